@@ -1,4 +1,6 @@
 import os
+import time
+import threading
 import streamlit as st
 from dotenv import load_dotenv
 from src.SimpleRAG import SimpleRAG
@@ -14,6 +16,56 @@ Settings.llm = SnowflakeLLM()
 Settings.embed_model = SnowflakeEmbedding()
 
 
+@st.cache_resource
+def get_engine():
+    """
+    Build the engine once per process instead of on every script rerun.
+    """
+    from src.RAGQueryEngine import RAGQueryEngine
+
+    return RAGQueryEngine()
+    # return SimpleRAG()
+
+
+def render_stream(placeholder, response, max_fps):
+    """
+    Render the streamed answer, repainting at most `max_fps` times a second (the tokens in between are coalesced).
+    The stream is closed however the rendering ends (so a rerun or a closed page stops the generation too).
+
+    Returns:
+        str: The full answer.
+    """
+    interval = 1 / max_fps if max_fps > 0 else 0
+    answer = ""
+    pending = []
+    last_render = 0
+    try:
+        for chunk in response:
+            pending.append(chunk.delta.replace("'", ""))
+            now = time.monotonic()
+            if now - last_render >= interval:
+                answer += "".join(pending)
+                pending.clear()
+                placeholder.markdown(answer)
+                last_render = now
+    finally:
+        if hasattr(response, "close"):
+            response.close()
+
+    return answer + "".join(pending)
+
+
+def render_stats(rag):
+    """
+    Debug sidebar with the counters of the caches & the query router (SHOW_CACHE_STATS=true).
+    """
+    if os.getenv("SHOW_CACHE_STATS", "false").lower() != "true" or not hasattr(rag, "stats"):
+        return
+
+    with st.sidebar.expander("Cache stats"):
+        st.json(rag.stats())
+
+
 def main(rag):
     # Display chat messages from history on app rerun
     for message in st.session_state.messages:
@@ -33,27 +85,29 @@ def main(rag):
             message_placeholder = st.empty()
             question = question.replace("'","") 
             progress_container = st.empty()
+            # A new question stops the generation of the previous one (if it is still running).
+            cancel_event = threading.Event()
+            if st.session_state.get("cancel_generation") is not None:
+                st.session_state.cancel_generation.set()
+            st.session_state.cancel_generation = cancel_event
+
             with progress_container.container():
                 with st.status("Looking for Answer", expanded=True):
-                    response = rag.query(question)
+                    response = rag.query(question, cancel_event)
 
             progress_container.empty()
 
             response, relative_paths = response["result"], response["references"]
 
-            answer = ""
             references = "" if len(relative_paths.keys()) == 0 else "\n### References: \n" + "\n".join([f"- [{key}]({relative_paths[key]})" for key in relative_paths.keys()])
-            for ans in response:
-                answer = ans.text.replace("'", "")
-                message_placeholder.markdown(answer)
+            answer = render_stream(message_placeholder, response, float(os.getenv("STREAM_MAX_FPS", "15")))
         
             message_placeholder.markdown(answer + references)
         st.session_state.messages.append({"role": "assistant", "content": answer + references})
 
+    render_stats(rag)
 
-if __name__ == "__main__":
-    from src.RAGQueryEngine import RAGQueryEngine
 
-    rag = RAGQueryEngine()
-    # rag = SimpleRAG()
+if __name__ == "__main__":
+    rag = get_engine()
     main(rag)
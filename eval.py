@@ -46,7 +46,7 @@ def runEval(rag, app_name):
                 print("-" * 80)
 
 
-app_name = f"{os.getenv("APP_NAME")} Eval"
+app_name = f"{os.getenv('APP_NAME')} Eval"
 try:
     snowpark_session = get_active_session()
 except:
@@ -56,6 +56,12 @@ run_dashboard(session, port=os.getenv("TRULENS_PORT"))
 
 
 rag = RAGQueryEngine()
+# Every question is evaluated on its own answer.
+rag.semantic_cache = None
 runEval(rag, app_name)
+if rag.query_router is not None:
+    print("Query router:", rag.query_router.stats())
+if rag.decomposition_cache is not None:
+    print("Decomposition cache:", rag.decomposition_cache.stats())
 
 snowpark_session.close()
\ No newline at end of file
@@ -0,0 +1,143 @@
+"""
+Checks that `chunkMarkdown` produces the same chunks as the previous implementation on the processed docs
+(PROCESSED_OUTPUT) and compares their speed.
+
+Usage: python scripts/benchChunker.py
+"""
+import os
+import re
+import time
+from dotenv import load_dotenv
+load_dotenv(".env")
+
+from nextUtil import chunkMarkdown
+
+
+def legacyChunkMarkdown(content):
+    """
+    The previous (recursive, regex per word) chunker. Kept only as the reference for this benchmark.
+    """
+    heading_pattern = r"^(#{1,6})\s+(.+)$"
+    
+    def getChunks(text, max_size, headings_stack):
+        """Recursive function to chunk the markdown based on heading levels."""
+        chunks = []
+        lines = text.splitlines()
+        buffer = []
+        current_heading = ""
+        in_code_block = False
+
+        for line in lines:
+            if line.strip().startswith("```"):
+                in_code_block = not in_code_block
+
+            if not in_code_block:
+                heading_match = re.match(heading_pattern, line)
+                if heading_match:
+                    if buffer:
+                        # Process the current buffer as a chunk
+                        chunks += splitBuffer(buffer, max_size, headings_stack)
+                        buffer = []
+
+                    current_heading = heading_match.group(0)  # Full heading with level
+                    current_heading_level = len(heading_match.group(1))
+
+                    # Only adjust the headings stack up to the current heading level
+                    while (
+                        len(headings_stack) > 0 and 
+                        current_heading_level <= len(re.match(heading_pattern, headings_stack[-1]).group(1))
+                    ):
+                        headings_stack = headings_stack[:-1]
+
+                    headings_stack.append(current_heading)
+                    continue
+
+            buffer.append(line)
+
+        if buffer:
+            # Process remaining buffer
+            chunks += splitBuffer(buffer, max_size, headings_stack)
+
+        return chunks
+
+    def splitBuffer(buffer, max_size, headings_stack):
+        """Split buffer content into chunks if it exceeds the size."""
+        chunks = []
+        content = "\n".join(buffer)
+        words = content.split()
+
+        if len(words) <= max_size:
+            chunk_content = "\n".join(headings_stack).strip() + "\n" + content
+            # Skip chunks that are just headings
+            if not all(re.match(heading_pattern, line) for line in content.splitlines()):
+                chunks.append(chunk_content)
+        else:
+            current_chunk = []
+            word_count = 0
+
+            for word in words:
+                current_chunk.append(word)
+                word_count += 1
+                if word_count >= max_size:
+                    # Ensure we don't split in the middle of a code block or list
+                    joined_chunk = " ".join(current_chunk)
+                    if re.search(r"```", joined_chunk) and joined_chunk.count("```") % 2 != 0:
+                        continue
+                    if re.search(r"\n\s*[-*]\s", joined_chunk):
+                        continue
+
+                    chunk_content = "\n".join(headings_stack).strip() + "\n" + " ".join(current_chunk)
+                    chunks.append(chunk_content)
+                    current_chunk = []
+                    word_count = 0
+
+            if current_chunk:
+                chunk_content = "\n".join(headings_stack).strip() + "\n" + " ".join(current_chunk)
+                chunks.append(chunk_content)
+
+        return chunks
+
+    if not content.strip():
+        return []
+
+    return getChunks(content, 385, []), {}
+
+
+def loadDocuments(folder):
+    documents = []
+    for root, _, files in os.walk(folder):
+        for file in files:
+            with open(os.path.join(root, file), 'r', encoding='utf-8') as fp:
+                documents.append((os.path.join(root, file), fp.read()))
+
+    return documents
+
+
+def timeChunker(chunker, documents, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for _, content in documents:
+            chunker(content)
+
+    return (time.perf_counter() - start) / rounds
+
+
+if __name__ == "__main__":
+    documents = loadDocuments(os.getenv("PROCESSED_OUTPUT"))
+    print(f"Documents: {len(documents)}")
+
+    mismatches = [path for path, content in documents if chunkMarkdown(content) != legacyChunkMarkdown(content)]
+    for path in mismatches:
+        print(f"Mismatch: {path}")
+    print(f"Mismatches: {len(mismatches)}/{len(documents)}")
+
+    rounds = int(os.getenv("BENCH_ROUNDS", "3"))
+    legacy_time = timeChunker(legacyChunkMarkdown, documents, rounds)
+    current_time = timeChunker(chunkMarkdown, documents, rounds)
+    print(f"Previous: {legacy_time:.3f}s, Current: {current_time:.3f}s, Speedup: {legacy_time / max(current_time, 1e-9):.1f}x")
+
+    # Largest documents separately, these are the ones that used to be slow.
+    largest = sorted(documents, key=lambda document: len(document[1]), reverse=True)[:10]
+    legacy_time = timeChunker(legacyChunkMarkdown, largest, rounds)
+    current_time = timeChunker(chunkMarkdown, largest, rounds)
+    print(f"Largest 10 documents. Previous: {legacy_time:.3f}s, Current: {current_time:.3f}s, Speedup: {legacy_time / max(current_time, 1e-9):.1f}x")
@@ -0,0 +1,103 @@
+"""
+Checks that `processFile` returns the same title, content & metadata as the previous implementation on every
+extracted version (ZIP_EXTRACTION_FOLDER) and compares their speed.
+
+Usage: python scripts/benchProcessFile.py
+"""
+import os
+import re
+import time
+import yaml
+from dotenv import load_dotenv
+load_dotenv(".env")
+
+from nextUtil import processFile, getSource, getRouter
+
+
+def legacyProcessFile(path):
+    """
+    The previous implementation (YAML for every header, a regex pass per step). Kept only as the reference for this benchmark.
+    """
+    def filterRouterContent(content, router):
+        tag = "<AppOnly>" if router == "app" else "<PagesOnly>"
+        remove_tag = "<AppOnly>" if tag == "<PagesOnly>" else "<PagesOnly>"
+
+        remove_pattern = fr'{remove_tag}(.*?)<\/{remove_tag[1:]}'
+        content = re.sub(remove_pattern, '', content, flags=re.DOTALL)
+
+        content = re.sub(fr'{tag}', '', content, flags=re.DOTALL)
+        content = re.sub(fr'<\/{tag[1:]}', '', content, flags=re.DOTALL)
+
+        content = re.sub(r'\n{3,}', '\n', content, flags=re.DOTALL)
+
+        return content
+
+    content = ""
+    with open(path, 'r', encoding='utf-8') as fp:
+        content = fp.read()
+
+    lines = content.strip().split("\n")
+    metadata_lines = lines[1:lines.index("---", 1)]
+
+    try:
+        source_path = getSource(path, metadata_lines)
+        if source_path is not None:
+            with open(source_path, 'r', encoding='utf-8') as fp:
+                content = fp.read()
+
+            lines = content.strip().split("\n")
+            metadata_lines = lines[1:lines.index("---", 1)]
+
+    except Exception as e:
+        print(e)
+
+    metadata_dict = yaml.safe_load("\n".join(metadata_lines))
+
+    content = "\n".join(content.split("\n")[len(metadata_lines) + 2:])
+
+    content = re.sub(r'{\/\*.*?\*\/}', '', content, flags=re.DOTALL)
+    content = re.sub(r'\n{3,}', '\n', content, flags=re.DOTALL)
+    content = content.strip()
+
+    if len(metadata_lines) + 2 == len(lines):
+        return None, None, None
+
+    router = getRouter(path)
+    if router is not None:
+        content = filterRouterContent(content, getRouter(path))
+
+    return metadata_dict.get("title", ""), content.strip(), {"description": metadata_dict.get("description", "")}
+
+
+def outcome(function, path):
+    try:
+        return function(path)
+    except Exception as e:
+        return type(e)
+
+
+def timeProcessFile(function, paths, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for path in paths:
+            outcome(function, path)
+
+    return (time.perf_counter() - start) / rounds
+
+
+if __name__ == "__main__":
+    extracted_data = os.getenv("ZIP_EXTRACTION_FOLDER")
+    paths = []
+    for root, _, files in os.walk(extracted_data):
+        paths += [os.path.join(root, file) for file in files]
+    print(f"Documents: {len(paths)}")
+
+    mismatches = [path for path in paths if outcome(processFile, path) != outcome(legacyProcessFile, path)]
+    for path in mismatches:
+        print(f"Mismatch: {path}")
+    print(f"Mismatches: {len(mismatches)}/{len(paths)}")
+
+    rounds = int(os.getenv("BENCH_ROUNDS", "3"))
+    legacy_time = timeProcessFile(legacyProcessFile, paths, rounds)
+    current_time = timeProcessFile(processFile, paths, rounds)
+    print(f"Previous: {legacy_time:.3f}s, Current: {current_time:.3f}s, Speedup: {legacy_time / max(current_time, 1e-9):.1f}x")
@@ -0,0 +1,95 @@
+"""
+Builds the local embedding index used by `LocalVectorRetriever` (RETRIEVAL_BACKEND=local, or as the fallback when
+Cortex Search is slow) from the staging data.
+
+The chunks are embedded with the same Cortex model the app embeds the queries with (`SnowflakeEmbedding`) and a
+chunk which is the same in multiple versions is only embedded once.
+
+Usage: python scripts/buildLocalIndex.py
+"""
+import os
+import sys
+import time
+import shutil
+import numpy as np
+from dotenv import load_dotenv
+load_dotenv(".env")
+
+from deltaLoad import getContentId
+from staging import readRecords
+
+# Allow the scripts to use the shared modules from src.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.ChunkStore import ChunkStore
+
+
+def buildLocalIndex(folder, embed_texts, batch_size = 100):
+    """
+    Args:
+        folder (str): Where the index is saved (replaced once the new one is complete).
+        embed_texts (Callable[[List[str]], List[List[float]]]): Embeds a batch of texts.
+        batch_size (int): Number of texts embedded at once.
+
+    Returns:
+        int: Number of chunks in the index.
+    """
+    start_time = time.time()
+    build_folder = folder + ".tmp"
+    if os.path.exists(build_folder):
+        shutil.rmtree(build_folder)
+
+    # Row (in the distinct embeddings) of every chunk.
+    unique = {}
+    rows = []
+    pending = []
+    vectors = []
+
+    def flush():
+        if pending:
+            vectors.extend(embed_texts(pending))
+            print(f"Embedded {len(vectors)} distinct chunks")
+            pending.clear()
+
+    def getRecords():
+        for record in readRecords(os.getenv("CHUNK_CSV_OUTPUT")):
+            content_id = getContentId(record['relative_path'], record['title'], record['description'], record['file_content'])
+            if content_id not in unique:
+                unique[content_id] = len(unique)
+                pending.append(record['file_content'])
+                if len(pending) >= batch_size:
+                    flush()
+
+            rows.append(unique[content_id])
+            yield record
+
+    count = ChunkStore.write(build_folder, getRecords(), ["version"])
+    flush()
+
+    dims = len(vectors[0]) if vectors else int(os.getenv("CORTEX_EMBEDDING_DIMS", "768"))
+    matrix = np.asarray(vectors, dtype=np.float32).reshape(-1, dims)
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+    embeddings = np.lib.format.open_memmap(
+        os.path.join(build_folder, "embeddings.npy"), mode="w+", dtype=np.float32, shape=(count, dims)
+    )
+    rows = np.asarray(rows, dtype=np.int64)
+    for start in range(0, count, 10000):
+        embeddings[start:start + 10000] = matrix[rows[start:start + 10000]]
+    embeddings.flush()
+    del embeddings
+
+    if os.path.exists(folder):
+        shutil.rmtree(folder)
+    os.rename(build_folder, folder)
+
+    print(f"Local index: {count} chunks, {len(unique)} embedded, {dims} dims, built in {time.time() - start_time:.1f}s")
+    return count
+
+
+if __name__ == "__main__":
+    from src.SnowflakeEmbedding import SnowflakeEmbedding
+
+    model = SnowflakeEmbedding()
+
+    buildLocalIndex(os.getenv("LOCAL_INDEX_PATH", "localIndex"), model.get_text_embedding_batch, model.embed_batch_size)
+    print("Embedding cache:", model.cache_stats())
@@ -0,0 +1,79 @@
+"""
+Bulk loading into Snowflake. Rows are written to compressed CSV part files, uploaded to the table stage and
+loaded with a single COPY INTO, instead of sending them through executemany.
+"""
+import os
+import csv
+import gzip
+import time
+import uuid
+import tempfile
+
+
+def writeParts(folder, columns, rows, file_rows):
+    """
+    Split the rows into gzipped CSV files of at most `file_rows` rows.
+
+    Returns:
+        List[str]: Paths of the files written.
+    """
+    paths = []
+    for part, start in enumerate(range(0, len(rows), file_rows)):
+        path = os.path.join(folder, f"part_{part:05d}.csv.gz")
+        with gzip.open(path, 'wt', encoding='utf-8', newline='') as fp:
+            writer = csv.writer(fp, quoting=csv.QUOTE_ALL)
+            writer.writerow(columns)
+            writer.writerows(rows[start:start + file_rows])
+        paths.append(path)
+
+    return paths
+
+
+def bulkLoad(cursor, table, columns, rows, file_rows = None, parallel = None):
+    """
+    Load the rows into the table with one stage upload & one COPY INTO.
+
+    Args:
+        cursor: Snowflake cursor.
+        table (str): Name of the table.
+        columns (List[str]): Columns of the rows (in order).
+        rows (List[tuple]): Rows to load.
+        file_rows (int): Maximum number of rows per uploaded file (`LOAD_FILE_ROWS`).
+        parallel (int): Number of threads uploading the files (`LOAD_PARALLEL`).
+
+    Returns:
+        int: Number of rows loaded.
+    """
+    if len(rows) == 0:
+        return 0
+
+    file_rows = file_rows or int(os.getenv("LOAD_FILE_ROWS", "50000"))
+    parallel = parallel or int(os.getenv("LOAD_PARALLEL", "4"))
+    # Unique prefix so the files of other loads in the stage are never picked up.
+    stage = f"@%{table}/load_{uuid.uuid4().hex}"
+    start_time = time.time()
+
+    with tempfile.TemporaryDirectory() as folder:
+        paths = writeParts(folder, columns, rows, file_rows)
+        print(f"Wrote {len(rows)} rows into {len(paths)} file(s) in {time.time() - start_time:.1f}s")
+
+        # All the parts with a single PUT, the client uploads them in parallel.
+        pattern = os.path.join(folder, "part_*.csv.gz").replace(os.sep, '/')
+        cursor.execute(f"PUT 'file://{pattern}' {stage} AUTO_COMPRESS=FALSE PARALLEL={parallel}")
+        # A row per file: source, target, source_size, target_size, source_compression, target_compression, status, message.
+        results = cursor.fetchall()
+        uploaded = sum(row[6] == "UPLOADED" for row in results)
+        print(f"Uploaded {uploaded}/{len(paths)} file(s) ({sum(row[3] for row in results) / 1024 / 1024:.1f} MB) in {time.time() - start_time:.1f}s")
+        if uploaded < len(paths):
+            failed = [f"{row[0]}: {row[6]} {row[7]}" for row in results if row[6] != "UPLOADED"]
+            raise Exception(f"Stage upload failed for {len(paths) - uploaded} file(s): {', '.join(failed)}")
+
+    cursor.execute(
+        f"""COPY INTO {table} ({', '.join(columns)}) FROM {stage}
+        FILE_FORMAT = (TYPE = CSV SKIP_HEADER = 1 FIELD_OPTIONALLY_ENCLOSED_BY = '"' ESCAPE_UNENCLOSED_FIELD = NONE COMPRESSION = GZIP)
+        PURGE = TRUE"""
+    )
+
+    elapsed = time.time() - start_time
+    print(f"Loaded {len(rows)} rows into {table} in {elapsed:.1f}s ({len(rows) / max(elapsed, 1e-6):.0f} rows/s)")
+    return len(rows)
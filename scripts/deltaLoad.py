@@ -0,0 +1,111 @@
+"""
+Delta loading of rows into a table. Every row carries an identity (a hash of the things that define it),
+so loading only inserts the rows that are new and deletes the ones that vanished, the rest is left alone.
+
+The queries are plain SQL so the same code works on Snowflake and on a local SQLite database (with placeholder "?").
+"""
+import hashlib
+
+
+def hashParts(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\0')
+
+    return digest.hexdigest()
+
+
+def getChunkId(version, path, ordinal, content):
+    """
+    Identity of a chunk: changes whenever the version, file, position or content of the chunk changes.
+    """
+    return hashParts(version, path, ordinal, content)
+
+
+def getContentId(path, title, description, content):
+    """
+    Identity of a chunk's content (DOC_STORAGE_MODE=dedup): the same in every version where the chunk didn't change.
+    """
+    return hashParts(path, title, description, content)
+
+
+def syncRows(
+    cursor, table, key_column, columns, rows, scope = None, placeholder = "%s", batch_size = 500, insert = None, delete = True,
+    load_batch_size = 50000
+):
+    """
+    Make the rows of the table (within scope) exactly the given rows.
+
+    The rows are only iterated once and the new ones are loaded every `load_batch_size` rows, so they can be streamed
+    (only the keys are kept in memory).
+
+    Args:
+        cursor: DB-API cursor.
+        table (str): Name of the table.
+        key_column (str): Column with the identity of the row.
+        columns (List[str]): Columns of the given rows, must include the key column.
+        rows (Iterable[tuple]): Rows to be present in the table.
+        scope (tuple | None): (column, value) limiting the sync to a part of the table (for example a version).
+        placeholder (str): Parameter placeholder of the driver.
+        insert (Callable[[List[tuple]], Any]): Optional, loads the new rows (for example `bulkLoad`). Defaults to executemany in batches.
+        delete (bool): Set False to only insert the new rows and keep the rest.
+        load_batch_size (int): Maximum number of new rows loaded at once.
+
+    Returns:
+        tuple: Number of rows inserted and deleted.
+    """
+    key_idx = columns.index(key_column)
+    where, params = ("", ())
+    if scope is not None:
+        where, params = (f" WHERE {scope[0]} = {placeholder}", (scope[1],))
+
+    cursor.execute(f"SELECT {key_column} FROM {table}{where}", params)
+    existing = set(row[0] for row in cursor.fetchall())
+
+    def load(new_rows):
+        if insert is not None:
+            insert(new_rows)
+        else:
+            insertRows(cursor, table, columns, new_rows, placeholder, batch_size)
+
+    new_keys = set()
+    to_insert = []
+    inserted = 0
+    # Insert before deleting, so the table never misses the rows of a scope completely.
+    for row in rows:
+        if row[key_idx] in new_keys:
+            continue
+        new_keys.add(row[key_idx])
+        if row[key_idx] not in existing:
+            to_insert.append(row)
+
+        if len(to_insert) >= load_batch_size:
+            load(to_insert)
+            inserted += len(to_insert)
+            to_insert = []
+
+    load(to_insert)
+    inserted += len(to_insert)
+
+    to_delete = list(existing - new_keys - {None}) if delete else []
+
+    for start in range(0, len(to_delete), batch_size):
+        batch = to_delete[start:start + batch_size]
+        cursor.execute(
+            f"DELETE FROM {table} WHERE {key_column} IN ({', '.join([placeholder] * len(batch))})", tuple(batch)
+        )
+
+    # Rows loaded before they had an identity.
+    if delete and None in existing:
+        condition = f"{where} AND" if where else " WHERE"
+        cursor.execute(f"DELETE FROM {table}{condition} {key_column} IS NULL", params)
+
+    return inserted, len(to_delete)
+
+
+def insertRows(cursor, table, columns, rows, placeholder = "%s", batch_size = 500):
+    command = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join([placeholder] * len(columns))})"
+    for start in range(0, len(rows), batch_size):
+        print(f"Inserting rows: {start}-{min(start + batch_size, len(rows))}/{len(rows)}")
+        cursor.executemany(command, rows[start:start + batch_size])
@@ -1,30 +1,68 @@
 import os
+import json
 import shutil
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 
 
 def extractDocsFromMainFolder(zip_path, output_dir, zip_filename):
+    """
+    Stream the docs members of the zip straight to their final path in the output directory.
+
+    The size & CRC of every extracted member is saved next to the zip, so on the next run only the
+    members that changed are written again (and the ones which are not in the zip anymore are deleted).
+    """
+    manifest_path = zip_path + ".extract.json"
+    previous = {}
+    if os.path.exists(manifest_path) and os.path.isdir(output_dir):
+        with open(manifest_path, 'r', encoding='utf-8') as fp:
+            previous = json.load(fp)
+
     with zipfile.ZipFile(zip_path, 'r') as zip_ref:
         all_files = zip_ref.namelist()
         main_folder = all_files[0]
         docs_folder = main_folder + os.getenv("CONTENT_FOLDER")
 
-        docs_files = [file for file in all_files if file.startswith(docs_folder)]
-        
-        if docs_files:
-            os.makedirs(output_dir, exist_ok=True)
-
-            for file in docs_files:
-                zip_ref.extract(file, output_dir)
-                rename = os.path.join(output_dir, file[len(docs_folder):])
-                if not os.path.exists(rename):
-                    os.rename(os.path.join(output_dir, file), rename)
-                
-            print(f"Extracted 'docs' folder from {zip_path} to {output_dir}")
-        else:
+        docs_files = [info for info in zip_ref.infolist() if info.filename.startswith(docs_folder)]
+
+        if not docs_files:
             print(f"No 'docs' folder found in {zip_path}.")
+            return
+
+        os.makedirs(output_dir, exist_ok=True)
+        output_root = os.path.abspath(output_dir)
+        current = {}
+        written = 0
+
+        for info in docs_files:
+            relative_path = info.filename[len(docs_folder):]
+            target = os.path.abspath(os.path.join(output_dir, *relative_path.split("/")))
+            # Never write outside the output directory.
+            if not relative_path or not target.startswith(output_root + os.path.sep):
+                continue
 
-        shutil.rmtree(os.path.join(output_dir, main_folder))
+            if info.is_dir():
+                os.makedirs(target, exist_ok=True)
+                continue
+
+            current[relative_path] = [info.file_size, info.CRC]
+            if previous.get(relative_path) == current[relative_path] and os.path.exists(target):
+                continue
+
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with zip_ref.open(info) as source, open(target, 'wb') as destination:
+                shutil.copyfileobj(source, destination, 1024 * 1024)
+            written += 1
+
+    for relative_path in previous.keys() - current.keys():
+        target = os.path.join(output_dir, *relative_path.split("/"))
+        if os.path.exists(target):
+            os.remove(target)
+
+    with open(manifest_path, 'w', encoding='utf-8') as fp:
+        json.dump(current, fp)
+
+    print(f"Extracted 'docs' folder from {zip_path} to {output_dir} ({written} written, {len(current) - written} unchanged)")
 
 
 def extract():
@@ -37,8 +75,17 @@ def extract():
 
     zip_files = [f for f in os.listdir(docs_folder) if f.endswith('.zip')]
 
-    for zip_file in zip_files:
-        zip_path = os.path.join(docs_folder, zip_file)
-        output_dir_name = os.path.splitext(zip_file)[0]
-        output_dir_path = os.path.join(output_root, output_dir_name)
-        extractDocsFromMainFolder(zip_path, output_dir_path, zip_file)
\ No newline at end of file
+    # Decompression releases the GIL, so threads are enough to extract the zips in parallel.
+    with ThreadPoolExecutor(max_workers=int(os.getenv("EXTRACT_WORKERS", "4"))) as executor:
+        futures = []
+        for zip_file in zip_files:
+            zip_path = os.path.join(docs_folder, zip_file)
+            output_dir_name = os.path.splitext(zip_file)[0]
+            output_dir_path = os.path.join(output_root, output_dir_name)
+            futures.append(executor.submit(extractDocsFromMainFolder, zip_path, output_dir_path, zip_file))
+
+        for zip_file, future in zip(zip_files, futures):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Failed to extract {zip_file}: {e}")
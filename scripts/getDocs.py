@@ -1,23 +1,38 @@
 import os
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
 
 
-def downloadRepo():
+def getSession(pool_size):
     """
-    Download all the Repositories.
+    A pooled session (with retries) shared by all the requests to GitHub.
     """
-    repo_name = os.getenv("REPO_NAME")
-    major_version = int(os.getenv("MAJOR_VERSION"))
-    minor_version = int(os.getenv("MINOR_VERSION"))
-    zip_download_folder = os.getenv("ZIP_DOWNLOAD_FOLDER")
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=Retry(total=3, backoff_factor=1, status_forcelist=[502, 503, 504])
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
 
-    if not os.path.exists(zip_download_folder):
-        os.mkdir(zip_download_folder)
+    # Authenticated requests have a much higher rate limit.
+    if os.getenv("GITHUB_TOKEN"):
+        session.headers["Authorization"] = f"Bearer {os.getenv('GITHUB_TOKEN')}"
+
+    return session
 
-    consider = []
-    # Only these many are allowed (maybe look into authentication setup).
+
+def getReleases(session, repo_name):
+    """
+    Tags of all the releases (newest first).
+    """
+    tags = []
+    # Only these many are allowed.
     for page_num in range(1, 11):
-        response = requests.get(
+        response = session.get(
             f"https://api.github.com/repos/{repo_name}/releases?per_page=100&page={page_num}"
         )
 
@@ -26,9 +41,102 @@ def downloadRepo():
 
         for release in releases:
             if release['tag_name'].startswith("v") and "-" not in release['tag_name']:
-                consider.append(release['tag_name'][1:])
+                tags.append(release['tag_name'][1:])
                 print("-->", release['tag_name'][1:], release['created_at'])
 
+        # This was the last page.
+        if len(releases) < 100:
+            break
+
+    return tags
+
+
+def readEtag(path):
+    if not os.path.exists(path):
+        return None
+
+    with open(path, 'r') as fp:
+        return fp.read().strip() or None
+
+
+def downloadFile(session, url, save_path):
+    """
+    Stream the file to disk. A partially downloaded file is resumed with a Range request and an already
+    downloaded file is only fetched again if its ETag changed.
+
+    The ETag of the downloaded file is kept next to it and the one of a download in progress next to the
+    partial file, it only replaces the former once the download is complete.
+    """
+    part_path = save_path + ".part"
+    etag_path = save_path + ".etag"
+    part_etag_path = part_path + ".etag"
+    part_etag = readEtag(part_etag_path)
+
+    headers = {}
+    if os.path.exists(part_path) and part_etag is not None:
+        # Only resume if the file is still the same.
+        headers["Range"] = f"bytes={os.path.getsize(part_path)}-"
+        headers["If-Range"] = part_etag
+    elif os.path.exists(save_path):
+        etag = readEtag(etag_path)
+        # Files downloaded without an ETag can't be revalidated.
+        if etag is None:
+            return
+        headers["If-None-Match"] = etag
+
+    with session.get(url, headers=headers, stream=True, timeout=60) as response:
+        if response.status_code == 304:
+            print(f"{save_path} is up to date.")
+            return
+
+        if response.status_code == 416:
+            # The partial file is not valid anymore, start over.
+            os.remove(part_path)
+            os.remove(part_etag_path)
+            return downloadFile(session, url, save_path)
+
+        if response.status_code not in [200, 206]:
+            print(f"Failed to download file. HTTP status code: {response.status_code}")
+            return
+
+        # 200 means the server sent the whole file (no resume), saved before the download so an interrupted
+        # download can be resumed safely.
+        if response.status_code == 200:
+            etag = response.headers.get("ETag")
+            if etag is not None:
+                with open(part_etag_path, 'w') as fp:
+                    fp.write(etag)
+            elif os.path.exists(part_etag_path):
+                os.remove(part_etag_path)
+
+        with open(part_path, 'ab' if response.status_code == 206 else 'wb') as f:
+            for chunk in response.iter_content(chunk_size=1024 * 1024):
+                f.write(chunk)
+
+    os.replace(part_path, save_path)
+    if os.path.exists(part_etag_path):
+        os.replace(part_etag_path, etag_path)
+    elif os.path.exists(etag_path):
+        os.remove(etag_path)
+    print(f"File downloaded and saved to {save_path}")
+
+
+def downloadRepo():
+    """
+    Download all the Repositories.
+    """
+    repo_name = os.getenv("REPO_NAME")
+    major_version = int(os.getenv("MAJOR_VERSION"))
+    minor_version = int(os.getenv("MINOR_VERSION"))
+    zip_download_folder = os.getenv("ZIP_DOWNLOAD_FOLDER")
+    workers = int(os.getenv("DOWNLOAD_WORKERS", "4"))
+
+    if not os.path.exists(zip_download_folder):
+        os.mkdir(zip_download_folder)
+
+    session = getSession(workers)
+    consider = getReleases(session, repo_name)
+
     # This will sort them
     consider.reverse()
 
@@ -42,6 +150,7 @@ def downloadRepo():
 
 
     # Filter only the folders we have.
+    downloads = []
     for major in releases.keys():
         for minor in releases[major]:
             if int(major) < major_version or int(major) == major_version and int(minor) < minor_version:
@@ -50,13 +159,12 @@ def downloadRepo():
             print(f"Download v{major}.{minor}.0")
             url = f"https://api.github.com/repos/{repo_name}/zipball/v{major}.{minor}.0"
             save_path = f"{zip_download_folder}/v{major}.{minor}.0.zip"
+            downloads.append((url, save_path))
 
-            # Only download file if it is not present already.
-            if not os.path.exists(save_path):
-                response = requests.get(url)
-                if response.status_code == 200:
-                    with open(save_path, 'wb') as f:
-                        f.write(response.content)
-                    print(f"File downloaded and saved to {save_path}")
-                else:
-                    print(f"Failed to download file. HTTP status code: {response.status_code}")
\ No newline at end of file
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(downloadFile, session, url, save_path) for url, save_path in downloads]
+        for (url, _), future in zip(downloads, futures):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Failed to download {url}: {e}")
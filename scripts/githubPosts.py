@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import requests
+from datetime import datetime, timezone
+
+
+class GithubPostReader:
+    """
+    Streams issues or discussions from the GitHub GraphQL search one page at a time.
+
+    It asks for the biggest page GitHub allows, watches the `rateLimit` of every response (and the
+    secondary rate limit headers) and sleeps when the budget is about to run out. The `endCursor` of the pages
+    that were loaded is saved to a checkpoint file, so an interrupted sync resumes from where it stopped.
+    """
+    def __init__(self, type, checkpoint_dir = None, url = None, page_size = 100, max_retries = 5, sleep = time.sleep):
+        if type not in ["Issue", "Discussion"]:
+            raise ValueError("Invalid content type. Must be 'Issue' or 'Discussion'")
+
+        self.type = type
+        self.url = url or os.getenv("GITHUB_GRAPHQL_URL", "https://api.github.com/graphql")
+        self.page_size = page_size
+        self.max_retries = max_retries
+        self.sleep = sleep
+        self.checkpoint_path = os.path.join(checkpoint_dir or os.getenv("CHUNK_CSV_OUTPUT"), f"github_{type.lower()}.json")
+
+        self._session = requests.Session()
+        self._session.headers.update({
+            "Authorization": f"Bearer {os.getenv('GITHUB_TOKEN')}",
+            "Content-Type": "application/json"
+        })
+        self._query = f"""
+            query($query: String!, $cursor: String, $first: Int!) {{
+                rateLimit {{
+                    cost
+                    remaining
+                    resetAt
+                }}
+                search(query: $query, type: { type.upper() }, first: $first, after: $cursor) {{
+                    pageInfo {{
+                        hasNextPage
+                        endCursor
+                    }}
+                    nodes {{
+                        ... on { type } {{
+                            title
+                            url
+                            body
+                            updatedAt
+                        }}
+                    }}
+                }}
+            }}
+        """
+
+
+    def loadCheckpoint(self):
+        """
+        Returns:
+            dict | None: The search query & cursor of an interrupted sync.
+        """
+        if not os.path.exists(self.checkpoint_path):
+            return None
+
+        with open(self.checkpoint_path, 'r', encoding='utf-8') as fp:
+            return json.load(fp)
+
+
+    def saveCheckpoint(self, search_query, cursor):
+        with open(self.checkpoint_path + ".tmp", 'w', encoding='utf-8') as fp:
+            json.dump({"query": search_query, "cursor": cursor}, fp)
+        os.replace(self.checkpoint_path + ".tmp", self.checkpoint_path)
+
+
+    def clearCheckpoint(self):
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+
+    def pages(self, search_query, cursor = None):
+        """
+        Yields the nodes of each page along with the cursor to resume after it.
+        """
+        has_next_page = True
+        while has_next_page:
+            search_data = self.fetch(search_query, cursor)
+
+            # Pagination handling
+            has_next_page = search_data["pageInfo"]["hasNextPage"]
+            cursor = search_data["pageInfo"]["endCursor"]
+
+            yield [node for node in search_data["nodes"] if node], cursor
+
+
+    def fetch(self, search_query, cursor):
+        for attempt in range(self.max_retries + 1):
+            response = self._session.post(
+                self.url,
+                json = {
+                    "query": self._query,
+                    "variables": {"query": search_query, "cursor": cursor, "first": self.page_size}
+                }
+            )
+
+            if response.status_code == 200:
+                data = response.json()
+                if "errors" in data:
+                    raise Exception(f"Query failed: {data['errors']}")
+
+                self.respectRateLimit(data["data"]["rateLimit"])
+                return data["data"]["search"]
+
+            if attempt == self.max_retries or response.status_code not in [403, 429, 502, 503, 504]:
+                raise Exception(f"Query failed: {response.status_code}, {response.text}")
+
+            wait = self.retryAfter(response, attempt)
+            print(f"GitHub responded with {response.status_code}, retrying in {wait:.0f}s.")
+            self.sleep(wait)
+
+
+    def retryAfter(self, response, attempt):
+        """
+        Seconds to wait before retrying a failed request (secondary rate limits tell us, otherwise exponential backoff).
+        """
+        if "Retry-After" in response.headers:
+            return float(response.headers["Retry-After"])
+
+        if response.headers.get("X-RateLimit-Remaining") == "0" and "X-RateLimit-Reset" in response.headers:
+            return max(float(response.headers["X-RateLimit-Reset"]) - time.time(), 0) + 1
+
+        return 2 ** attempt
+
+
+    def respectRateLimit(self, rate_limit):
+        """
+        Sleep until the budget resets if there isn't enough left for the next page.
+        """
+        if rate_limit["remaining"] >= 2 * max(rate_limit["cost"], 1):
+            return
+
+        reset_at = datetime.fromisoformat(rate_limit["resetAt"].replace("Z", "+00:00"))
+        wait = max((reset_at - datetime.now(timezone.utc)).total_seconds(), 0) + 1
+        print(f"GitHub rate limit almost exhausted ({rate_limit['remaining']} left), waiting {wait:.0f}s.")
+        self.sleep(wait)
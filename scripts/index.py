@@ -5,16 +5,19 @@ from extractDocs import extract
 from getDocs import downloadRepo
 from snowSetup import SnowSetup
 from processDocs import processAndChunk
-from nextUtil import processFile, chunkMarkdown
+from nextUtil import processFile, chunkMarkdown, getSource, chunk_config
 
-db = SnowSetup()
 
-# Data Prep from Docs
-downloadRepo()
-extract()
-processAndChunk(processFile, chunkMarkdown)
+# The guard is needed because the ingest workers (INGEST_WORKERS) may re-import this module.
+if __name__ == "__main__":
+    db = SnowSetup()
 
-# Data Prep from Discussion & Issues
-db.dbSetup()
+    # Data Prep from Docs
+    downloadRepo()
+    extract()
+    processAndChunk(processFile, chunkMarkdown, getSource, config=chunk_config)
 
-print("Setup Complete.")
\ No newline at end of file
+    # Data Prep from Discussion & Issues
+    db.dbSetup()
+
+    print("Setup Complete.")
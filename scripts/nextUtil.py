@@ -6,9 +6,25 @@ If you want to use this for other project you just need to create 2 functions (p
 import os
 import re
 import yaml
+from functools import lru_cache
+from tokenizer import getTokenizer
 
 extracted_data = os.getenv("ZIP_EXTRACTION_FOLDER")
 
+# Chunk sizes are measured in whitespace separated words or in tokens of CHUNK_TOKENIZER.
+chunk_config = {
+    "unit": os.getenv("CHUNK_SIZE_UNIT", "words"),
+    "max_size": int(os.getenv(
+        "CHUNK_MAX_SIZE", os.getenv("EMBEDDING_MAX_TOKENS", "512") if os.getenv("CHUNK_SIZE_UNIT") == "tokens" else "385"
+    )),
+    "overlap": int(os.getenv("CHUNK_OVERLAP", "0")),
+    "tokenizer": os.getenv("CHUNK_TOKENIZER", "whitespace"),
+}
+if not 0 <= chunk_config["overlap"] < chunk_config["max_size"]:
+    raise ValueError(
+        f"CHUNK_OVERLAP ({chunk_config['overlap']}) must be at least 0 and less than CHUNK_MAX_SIZE ({chunk_config['max_size']})"
+    )
+
 
 def processFile(path):
     """
@@ -25,55 +41,163 @@ def processFile(path):
     with open(path, 'r', encoding='utf-8') as fp:
         content = fp.read()
 
+    metadata_lines, has_content = splitFrontMatter(content)
+
     # See if there is a source mentioned for this document.
-    lines = content.strip().split("\n")
-    metadata_lines = lines[1:lines.index("---", 1)]
-    source_index = next((i for i, s in enumerate(metadata_lines) if s.startswith("source:")), None)
+    try:
+        source_path = getSource(path, metadata_lines)
+        if source_path is not None:
+            content, metadata_lines, has_content = readSource(source_path)
 
-    # If there is a source mentioned.
-    if source_index is not None:
-        source_path = metadata_lines[source_index].split(":")[-1].strip().replace("/", os.path.sep)
-        if source_path.startswith("'"):
-            source_path = source_path[1:-1]
-
-        try:    
-            source_path = os.path.join(os.path.sep.join(path.split(os.path.sep)[:2]), source_path)
-            source_path = getPathFromSource(source_path)
-            with open(source_path, 'r', encoding='utf-8') as fp:
-                content = fp.read()
-            
-            lines = content.strip().split("\n")
-            metadata_lines = lines[1:lines.index("---", 1)]
+    except Exception as e:
+        print(e)
 
-        except Exception as e:
-            print(e)
+    metadata_dict = parseFrontMatter(metadata_lines)
 
-    metadata_dict = yaml.safe_load("\n".join(metadata_lines))
+    # If no source is mentioned and file doesn't contain any content exclude it from indexing.
+    if not has_content:
+        return None, None, None
 
     # Remove metadata tag we have everything we need.
-    content = "\n".join(content.split("\n")[len(metadata_lines) + 2:])
+    content = content.split("\n", len(metadata_lines) + 2)[len(metadata_lines) + 2:]
+    content = cleanContent(content[0] if content else "", getRouter(path))
 
-    # Get rid of comments
-    content = re.sub(r'{\/\*.*?\*\/}', '', content, flags=re.DOTALL)
-    # Get rid of 3 or more consecutive newline characters.
-    content = re.sub(r'\n{3,}', '\n', content, flags=re.DOTALL)
-    content = content.strip()
+    return metadata_dict.get("title", ""), content, {"description": metadata_dict.get("description", "")}
 
-    # If no source is mentioned and file doesn't contain any content exclude it from indexing.
-    if len(metadata_lines) + 2 == len(lines):
-        return None, None, None
-        
-    router = getRouter(path)
+
+def splitFrontMatter(content):
+    """
+    Finds the front matter without splitting the whole document into lines.
+
+    Returns:
+        List[str]: The lines between the first line and the closing `---`.
+        bool: If there is anything after the front matter.
+    """
+    text = content.strip()
+    first_line_end = text.find("\n")
+    if first_line_end == -1:
+        raise ValueError("No front matter found.")
+
+    closing = text.find("\n---\n", first_line_end)
+    if closing == -1:
+        if not text.endswith("\n---") or len(text) - 4 < first_line_end:
+            raise ValueError("Front matter is not closed.")
+        closing = len(text) - 4
+
+    metadata_lines = text[first_line_end + 1:closing].split("\n") if closing > first_line_end else []
+    return metadata_lines, closing + 4 < len(text)
+
+
+# `key: value` lines that YAML would read as plain strings.
+front_matter_pattern = re.compile(r"^([A-Za-z_][\w-]*): +([^-?:,\[\]{}#&*!|>'\"%@`=<\d+.~\s].*?)[ \r]*$")
+yaml_keywords = {
+    "y", "Y", "yes", "Yes", "YES", "n", "N", "no", "No", "NO", "true", "True", "TRUE", "false", "False", "FALSE",
+    "on", "On", "ON", "off", "Off", "OFF", "null", "Null", "NULL",
+}
+
+
+def parseFrontMatter(metadata_lines):
+    """
+    Most front matters are only a few `key: value` lines, those are read directly. Anything else
+    (quotes, lists, multiline values, booleans, numbers, ...) is left to `yaml.safe_load`.
+    """
+    metadata = {}
+    for line in metadata_lines:
+        match = front_matter_pattern.match(line)
+        if (
+            match is None or match.group(1) in yaml_keywords or match.group(2) in yaml_keywords or
+            ": " in match.group(2) or ":\t" in match.group(2) or " #" in match.group(2) or "\t#" in match.group(2) or
+            match.group(2).endswith(":") or not match.group(2).isprintable()
+        ):
+            return yaml.safe_load("\n".join(metadata_lines))
+        metadata[match.group(1)] = match.group(2)
+
+    # Empty front matter is an error like before (yaml returns None).
+    return metadata if metadata else yaml.safe_load("\n".join(metadata_lines))
+
+
+def getRemovedItems(router, name):
+    """
+    Alternation of the items removed from the content: comments, blocks of the other router and the tags of this router.
+
+    Args:
+        name (str): Name of the group used inside the pattern (it has to be unique within the whole pattern).
+    """
+    comment = r"\{/\*.*?\*/\}"
+    items = [comment]
     if router is not None:
-        content = filterRouterContent(content, getRouter(path))
+        tag = "AppOnly" if router == "app" else "PagesOnly"
+        remove_tag = "AppOnly" if tag == "PagesOnly" else "PagesOnly"
+        # Comments are skipped as a whole (lookahead + backreference never backtracks into them),
+        # so a closing tag inside a comment doesn't end the block.
+        items.append(fr"<{remove_tag}>(?:(?=(?P<{name}>{comment}))(?P={name})|(?!{comment}).)*?</{remove_tag}>")
+        items.append(fr"</?{tag}>")
 
-    return metadata_dict.get("title", ""), content.strip(), {"description": metadata_dict.get("description", "")}
+    return "|".join(items)
+
+
+@lru_cache(maxsize=None)
+def getCleanupPatterns(router):
+    """
+    Returns:
+        re.Pattern: Matches the removed items along with the newlines around them, and the other runs of 3 or more newlines.
+        re.Pattern: Splits a match into its newline runs and removed items.
+    """
+    items = [getRemovedItems(router, f"comment{idx}") for idx in range(4)]
+    # Every branch starts with a literal character so the engine only tries the positions where a match can start.
+    return (
+        re.compile(fr"\n(?:\n*(?:{items[0]})(?:\n|{items[1]})*|\n\n+)|(?:{items[2]})(?:\n|{items[3]})*", flags=re.DOTALL),
+        re.compile(fr"\n+|{getRemovedItems(router, 'comment')}", flags=re.DOTALL)
+    )
+
+
+def collapseNewlines(count):
+    # 3 or more consecutive newline characters become one.
+    return count if count < 3 else 1
+
+
+def cleanContent(content, router):
+    """
+    Removes comments and filters the content for the router (if any) in a single scan.
+
+    Newlines are collapsed like removing the comments, collapsing, filtering the router & collapsing again would:
+    the runs joined by removed comments are collapsed first, then the runs joined by removed router blocks/tags.
+    """
+    pattern, token_pattern = getCleanupPatterns(router)
+
+    def replace(match):
+        text = match.group()
+        # Only newlines (3 or more).
+        if text.count("\n") == len(text):
+            return "\n"
+
+        # Newlines of the current run (joined by comments) & of the finished runs joined by router blocks/tags.
+        run = joined = 0
+        for token in token_pattern.finditer(text):
+            first = text[token.start()]
+            if first == "\n":
+                run += token.end() - token.start()
+            elif first == "<":
+                joined += collapseNewlines(run)
+                run = 0
+
+        return "\n" * collapseNewlines(joined + collapseNewlines(run))
+
+    return pattern.sub(replace, content).strip()
+
+
+# Compiled once, used on every line of every document.
+heading_pattern = re.compile(r"^(#{1,6})\s+(.+)$")
 
 
 def chunkMarkdown(content):
     """
     This method performs the chunking of the given markdown content.
 
+    The content is split at headings (outside code blocks) in a single pass, every chunk is prefixed with its
+    headings stack and sections longer than the max size are split further without breaking code blocks.
+    The size limit & overlap come from `chunk_config`.
+
     Args:
         content (str): This is the content of the markdown file that needs to be chunked.
 
@@ -81,90 +205,108 @@ def chunkMarkdown(content):
         List[str]: This is a list of all the chunks that were created.
         dict: This is a dictionary of the metadata related to each chunk. The value of each key is a list of length equals to the number of chunks.
     """
-    heading_pattern = r"^(#{1,6})\s+(.+)$"
-    
-    def getChunks(text, max_size, headings_stack):
-        """Recursive function to chunk the markdown based on heading levels."""
-        chunks = []
-        lines = text.splitlines()
-        buffer = []
-        current_heading = ""
-        in_code_block = False
-
-        for line in lines:
-            if line.strip().startswith("```"):
-                in_code_block = not in_code_block
-
-            if not in_code_block:
-                heading_match = re.match(heading_pattern, line)
-                if heading_match:
-                    if buffer:
-                        # Process the current buffer as a chunk
-                        chunks += splitBuffer(buffer, max_size, headings_stack)
-                        buffer = []
-
-                    current_heading = heading_match.group(0)  # Full heading with level
-                    current_heading_level = len(heading_match.group(1))
-
-                    # Only adjust the headings stack up to the current heading level
-                    while (
-                        len(headings_stack) > 0 and 
-                        current_heading_level <= len(re.match(heading_pattern, headings_stack[-1]).group(1))
-                    ):
-                        headings_stack = headings_stack[:-1]
-
-                    headings_stack.append(current_heading)
-                    continue
-
-            buffer.append(line)
-
-        if buffer:
-            # Process remaining buffer
-            chunks += splitBuffer(buffer, max_size, headings_stack)
-
-        return chunks
-
-    def splitBuffer(buffer, max_size, headings_stack):
-        """Split buffer content into chunks if it exceeds the size."""
-        chunks = []
-        content = "\n".join(buffer)
-        words = content.split()
-
-        if len(words) <= max_size:
-            chunk_content = "\n".join(headings_stack).strip() + "\n" + content
-            # Skip chunks that are just headings
-            if not all(re.match(heading_pattern, line) for line in content.splitlines()):
-                chunks.append(chunk_content)
-        else:
-            current_chunk = []
-            word_count = 0
-
-            for word in words:
-                current_chunk.append(word)
-                word_count += 1
-                if word_count >= max_size:
-                    # Ensure we don't split in the middle of a code block or list
-                    joined_chunk = " ".join(current_chunk)
-                    if re.search(r"```", joined_chunk) and joined_chunk.count("```") % 2 != 0:
-                        continue
-                    if re.search(r"\n\s*[-*]\s", joined_chunk):
-                        continue
-
-                    chunk_content = "\n".join(headings_stack).strip() + "\n" + " ".join(current_chunk)
-                    chunks.append(chunk_content)
-                    current_chunk = []
-                    word_count = 0
-
-            if current_chunk:
-                chunk_content = "\n".join(headings_stack).strip() + "\n" + " ".join(current_chunk)
-                chunks.append(chunk_content)
-
-        return chunks
-
     if not content.strip():
         return []
 
-    return getChunks(content, 385, []), {}
+    chunks = []
+    buffer = []
+    # (level, heading) pairs of the current section.
+    headings_stack = []
+    prefix = "\n"
+    in_code_block = False
+
+    for line in content.splitlines():
+        if line.strip().startswith("```"):
+            in_code_block = not in_code_block
+
+        if not in_code_block:
+            heading_match = heading_pattern.match(line)
+            if heading_match:
+                if buffer:
+                    # Process the current buffer as a chunk
+                    splitBuffer(buffer, prefix, chunks)
+                    buffer = []
+
+                # Only adjust the headings stack up to the current heading level
+                current_heading_level = len(heading_match.group(1))
+                while headings_stack and current_heading_level <= headings_stack[-1][0]:
+                    headings_stack.pop()
+
+                headings_stack.append((current_heading_level, heading_match.group(0)))
+                prefix = "\n".join(heading for _, heading in headings_stack).strip() + "\n"
+                continue
+
+        buffer.append(line)
+
+    if buffer:
+        # Process remaining buffer
+        splitBuffer(buffer, prefix, chunks)
+
+    return chunks, {}
+
+
+def splitBuffer(buffer, prefix, chunks):
+    """
+    Split buffer content into chunks (prefixed with the headings) if it exceeds the size.
+    """
+    content = "\n".join(buffer)
+    words = content.split()
+
+    if chunk_config["unit"] == "tokens":
+        count_tokens = getTokenizer(chunk_config["tokenizer"])
+        # Headings are part of the chunk that gets embedded.
+        max_size = max(chunk_config["max_size"] - count_tokens(prefix), 1)
+        fits = count_tokens(content) <= max_size
+        word_sizes = {}
+        getSize = lambda word: word_sizes.setdefault(word, count_tokens(word))
+    else:
+        max_size = chunk_config["max_size"]
+        fits = len(words) <= max_size
+        getSize = lambda word: 1
+
+    if fits:
+        # Skip chunks that are just headings
+        if not all(heading_pattern.match(line) for line in content.splitlines()):
+            chunks.append(prefix + content)
+        return
+
+    current_chunk = []
+    current_size = 0
+    # Words added after the overlap of the previous chunk.
+    new_words = 0
+    # Number of code fences seen so far, odd means we are inside a code block.
+    fence_count = 0
+
+    for word in words:
+        current_chunk.append(word)
+        current_size += getSize(word)
+        new_words += 1
+        fence_count += word.count("```")
+
+        # Ensure we don't split in the middle of a code block
+        if current_size >= max_size and fence_count % 2 == 0:
+            chunks.append(prefix + " ".join(current_chunk))
+            current_chunk, current_size = getOverlap(current_chunk, getSize)
+            new_words = 0
+
+    if new_words > 0:
+        chunks.append(prefix + " ".join(current_chunk))
+
+
+def getOverlap(words, getSize):
+    """
+    The trailing words of a chunk (up to the configured overlap) which are repeated at the start of the next one.
+    """
+    overlap = []
+    size = 0
+    for word in reversed(words):
+        if size + getSize(word) > chunk_config["overlap"]:
+            break
+        overlap.append(word)
+        size += getSize(word)
+
+    overlap.reverse()
+    return overlap, size
 
 
 def getRouter(path):
@@ -188,9 +330,100 @@ def getRouter(path):
     return path_dirs[0]
 
 
+def getSource(path, metadata_lines = None):
+    """
+    This is also a next.js specific method. It resolves the document mentioned as `source` in the front matter of a doc.
+
+    Args:
+        path (str): The path of the document.
+        metadata_lines (List[str]): Front matter lines of the document (read from the file if not given).
+
+    Returns:
+        str | None: Path of the source document or None if the document doesn't mention a source.
+    """
+    if metadata_lines is None:
+        with open(path, 'r', encoding='utf-8') as fp:
+            lines = fp.read().strip().split("\n")
+        metadata_lines = lines[1:lines.index("---", 1)]
+
+    source_index = next((i for i, s in enumerate(metadata_lines) if s.startswith("source:")), None)
+    if source_index is None:
+        return None
+
+    source_path = metadata_lines[source_index].split(":")[-1].strip().replace("/", os.path.sep)
+    if source_path.startswith("'"):
+        source_path = source_path[1:-1]
+
+    source_path = os.path.join(os.path.sep.join(path.split(os.path.sep)[:2]), source_path)
+
+    # Index the whole version once, the sources are then resolved from memory.
+    version_root = os.path.join(os.getcwd(), *path.split(os.path.sep)[:2])
+    if version_root not in directory_index and os.path.isdir(version_root):
+        indexDirectory(version_root)
+
+    resolved_path = getPathFromSource(source_path)
+    if resolved_path is None:
+        raise FileNotFoundError(f"Could not resolve source '{source_path}' of '{path}'.")
+
+    return resolved_path
+
+
+@lru_cache(maxsize=None)
+def readSource(path):
+    """
+    Reads a source document and splits its front matter. Cached because a source is shared by the docs of both routers.
+
+    Returns:
+        tuple: The content, its front matter lines and if it has anything after the front matter.
+    """
+    with open(path, 'r', encoding='utf-8') as fp:
+        content = fp.read()
+
+    return (content, *splitFrontMatter(content))
+
+
+# Listings of the directories used for resolving sources.
+# path -> (entries as (name, is_dir), entry names grouped by (name without the number prefix, is_dir))
+directory_index = {}
+
+
+def indexDirectory(root, recursive = True):
+    """
+    Index the directory (and everything inside it) with a single os.scandir walk.
+    """
+    stack = [root]
+    while stack:
+        path = stack.pop()
+        entries = []
+        with os.scandir(path) as iterator:
+            for entry in iterator:
+                entries.append((entry.name, entry.is_dir()))
+                if recursive and entries[-1][1]:
+                    stack.append(entry.path)
+
+        names = {}
+        for name, is_dir in entries:
+            names.setdefault((re.sub(r'^\d+-', '', name), is_dir), []).append(name)
+
+        directory_index[path] = (entries, names)
+
+
+def listDirectory(path):
+    if path not in directory_index:
+        if os.path.isfile(path):
+            raise NotADirectoryError(f"Path '{path}' is not a directory.")
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Path '{path}' does not exist.")
+        indexDirectory(path, recursive=False)
+
+    return directory_index[path]
+
+
+@lru_cache(maxsize=None)
 def getPathFromSource(source_path):
     """
     This is also a next.js specific method. This method resolves the path which is referenced as source in the documentation.
+    Directory listings come from `directory_index` and the results are memoized, so the disk is only read once.
 
     Args:
         source_path (str): This is the path mentioned in the source with the extraction directory and version
@@ -214,31 +447,22 @@ def getPathFromSource(source_path):
         Recursively find the path by exploring all matches for each part.
         """
         if not parts:
-            if os.path.exists(current_path) and os.path.isdir(current_path):
+            if current_path in directory_index or os.path.isdir(current_path):
                 parts.append("index")
                 return finePathRecursively(current_path, parts)
             
             return current_path
 
         part = parts[0]
+        entries, names = listDirectory(current_path)
 
-        if not os.path.exists(current_path):
-            raise FileNotFoundError(f"Path '{current_path}' does not exist.")
-
-        # Find all matches for the current part
-        matches = [
-            item
-            for item in os.listdir(current_path)
-            if item.endswith(part) and os.path.isdir(os.path.join(current_path, item))
-        ]
+        # Find all matches for the current part (exact names without the number prefix first)
+        matches = names.get((part, True)) or [name for name, is_dir in entries if is_dir and name.endswith(part)]
 
         if not matches:
             # If no directory matches look for file matches
-            matches = [
-                item
-                for item in os.listdir(current_path)
-                if item.endswith(part + ".mdx" if not part.endswith(".mdx") else part) and os.path.isfile(os.path.join(current_path, item))
-            ]
+            file_part = part + ".mdx" if not part.endswith(".mdx") else part
+            matches = names.get((file_part, False)) or [name for name, is_dir in entries if not is_dir and name.endswith(file_part)]
 
         if not matches:
             return None
@@ -252,29 +476,3 @@ def getPathFromSource(source_path):
         return None
 
     return finePathRecursively(current_path, parts)
-
-
-def filterRouterContent(content, router):
-    """
-    This is also a next.js specific method. Filter out the content based on the given router name.
-
-    Args:
-        content (str): The content of the source document.
-        router (str): The name of the router (pages or app).
-    """
-    # Get the tag for current router.
-    tag = "<AppOnly>" if router == "app" else "<PagesOnly>"
-    remove_tag = "<AppOnly>" if tag == "<PagesOnly>" else "<PagesOnly>"
-
-    remove_pattern = fr'{remove_tag}(.*?)<\/{remove_tag[1:]}'
-
-    # Remove the content of other router.
-    content = re.sub(remove_pattern, '', content, flags=re.DOTALL)
-
-    # Remove opening and closing tags of the current router.
-    content = re.sub(fr'{tag}', '', content, flags=re.DOTALL)
-    content = re.sub(fr'<\/{tag[1:]}', '', content, flags=re.DOTALL)
-
-    content = re.sub(r'\n{3,}', '\n', content, flags=re.DOTALL)
-
-    return content
@@ -1,6 +1,20 @@
 import os
 import re
-import pandas as pd
+import sys
+import json
+import time
+import shutil
+import inspect
+import hashlib
+from itertools import repeat
+from deltaLoad import getChunkId
+from staging import writeRow, readRows, readRecords
+from tokenizer import getTokenizer, getBucket, getBucketLabels
+from concurrent.futures import ProcessPoolExecutor
+
+# Allow the scripts to use the shared modules from src.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.LexicalIndex import LexicalIndex
 
 output_dir = os.getenv("PROCESSED_OUTPUT")
 
@@ -8,15 +22,17 @@ output_dir = os.getenv("PROCESSED_OUTPUT")
 extracted_data = os.getenv("ZIP_EXTRACTION_FOLDER")
 staging_data = os.getenv("CHUNK_CSV_OUTPUT")
 
-chunk_count = 0
-files_processed = 0
-
 if not os.path.exists(output_dir):
     os.mkdir(output_dir)
 
 if not os.path.exists(staging_data):
     os.mkdir(staging_data)
 
+# Keeps the hashes of every file that is already present in the staging data.
+manifest_path = os.path.join(staging_data, "manifest.json")
+# Chunk rows added & removed by the last run of each version.
+changes_dir = os.path.join(staging_data, "changes")
+
 
 def getOutputPath(path):
     return path.replace(
@@ -25,85 +41,302 @@ def getOutputPath(path):
     )
 
 
-def traverseFolders(curr_path, df, version, processFile, chunkMarkdown, indent = 0):
-    global chunk_count
-    global files_processed
+def getRelativePath(path, version):
+    return path[len(extracted_data) + len(version) + 2:]
+
+
+def hashFile(path):
+    with open(path, 'rb') as fp:
+        return hashlib.sha256(fp.read()).hexdigest()
+
+
+def getFingerprint(config, *functions):
+    """
+    Hash of the processing & chunking code and config. Any change to it should reprocess every file.
+
+    The whole module of every function is hashed, so changes to the helpers they call are picked up too.
+    """
+    digest = hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8'))
+    modules = []
+    for function in functions:
+        module = inspect.getmodule(function)
+        if module in modules:
+            continue
+        modules.append(module)
+        try:
+            digest.update(inspect.getsource(module).encode('utf-8'))
+        except (OSError, TypeError):
+            digest.update(f"{function.__module__}.{function.__qualname__}".encode('utf-8'))
+
+    return digest.hexdigest()
+
+
+def loadManifest():
+    if not os.path.exists(manifest_path):
+        return {}
+
+    with open(manifest_path, 'r', encoding='utf-8') as fp:
+        return json.load(fp)
+
+
+def saveManifest(manifest):
+    with open(manifest_path + ".tmp", 'w', encoding='utf-8') as fp:
+        json.dump(manifest, fp)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+
+def getManifestEntry(path, getSource, fingerprint):
+    """
+    Hashes that decide if a file needs to be processed again: its content, the content of the
+    document it takes its content from (next.js `source`) and the processing code.
+    """
+    entry = {"content": hashFile(path), "source": None, "config": fingerprint}
+    if getSource is not None:
+        try:
+            source_path = getSource(path)
+            if source_path is not None:
+                entry["source"] = hashFile(source_path)
+        except Exception:
+            # processFile will report the sources it can't resolve.
+            pass
+
+    return entry
+
+
+def traverseFolders(curr_path, files = None):
+    """
+    Walks the folder once, mirrors its directory structure in the output folder and returns all the file paths in it.
+    """
+    files = [] if files is None else files
     for category in os.listdir(curr_path):
         path = os.path.join(curr_path, category)
-        # print("\t" * indent + path)
         
-        output_path = getOutputPath(path)
         if os.path.isdir(path):
+            output_path = getOutputPath(path)
             # Check if same output directory exists?
             if not os.path.isdir(output_path):
                 os.mkdir(output_path)
-            df = traverseFolders(path, df, version, processFile, chunkMarkdown, indent + 1)
+            traverseFolders(path, files)
         else:
-            files_processed += 1
-            try:
-                title, content, metadata = processFile(path)
-                
-                # # We saw that the content with single line is not much useful for us.
-                # if content is not None and len(content.split("\n")) > 1:
-                if content is not None:
-                    # Will be helpful for next step when chunking
-                    if not content.startswith("#"):
-                        content = f"# {title}\n\n" + content
-
-                    with open(output_path, 'w', encoding='utf-8') as fp:
-                        fp.write(content)
-
-                    chunks, chunk_info = chunkMarkdown(content)
-                    num_chunks = len(chunks)
-                    chunk_count += num_chunks
-
-                    df_dict = {
-                        'path': [path[len(extracted_data) + len(version) + 2:]] * num_chunks, 
-                        'title': [title] * num_chunks,
-                        'content': chunks
-                    }
-                    # Adding Metadata keys
-                    for key in metadata.keys():
-                        df_dict[key] = [metadata[key]] * num_chunks
-
-                    # Add Content specific keys
-                    for key in chunk_info.keys():
-                        df_dict[key] = chunk_info[key]
-
-                    chunks_df = pd.DataFrame(df_dict)
-
-                    df = pd.concat([df, chunks_df], ignore_index=True)
-            except Exception as e:
-                print(f"Failed for file: {path}")
-                print(f"Error: {e}")
-
-    return df
-
-
-def processAndChunk(processFile, chunkMarkdown):
+            files.append(path)
+
+    return files
+
+
+def processPath(path, version, processFile, chunkMarkdown):
+    """
+    Process & chunk a single file. This runs inside the worker processes, so it only returns plain rows.
+
+    Returns:
+        List[dict] | None: One row per chunk (empty if the file had nothing to index) or None if it failed.
+    """
+    rows = []
+    try:
+        title, content, metadata = processFile(path)
+        
+        # # We saw that the content with single line is not much useful for us.
+        # if content is not None and len(content.split("\n")) > 1:
+        if content is not None:
+            # Will be helpful for next step when chunking
+            if not content.startswith("#"):
+                content = f"# {title}\n\n" + content
+
+            with open(getOutputPath(path), 'w', encoding='utf-8') as fp:
+                fp.write(content)
+
+            chunks, chunk_info = chunkMarkdown(content)
+            relative_path = getRelativePath(path, version)
+
+            for idx, chunk in enumerate(chunks):
+                row = {
+                    'path': relative_path, 'title': title, 'content': chunk,
+                    'chunk': idx, 'chunk_id': getChunkId(version, relative_path, idx, chunk)
+                }
+                # Adding Metadata keys
+                row.update(metadata)
+                # Add Content specific keys
+                for key in chunk_info.keys():
+                    row[key] = chunk_info[key][idx]
+                rows.append(row)
+    except Exception as e:
+        print(f"Failed for file: {path}")
+        print(f"Error: {e}")
+        return None
+
+    return rows
+
+
+class ChunkStats:
+    """
+    Length stats of the chunks of a version, updated as the rows are written.
+
+    The chunk size limit (`max_size`) is checked in the unit of the chunking config (`count_size`, words by default).
+    """
+    def __init__(self, count_tokens, max_tokens, max_size = 385, count_size = None, unit = "words"):
+        self.count_tokens = count_tokens
+        self.max_tokens = max_tokens
+        self.max_size = max_size
+        self.count_size = count_size or (lambda content: len(content.split()))
+        self.unit = unit
+
+        self.count = 0
+        self.min_length = None
+        self.max_length = 0
+        self.exceeding_size = 0
+        self.exceeding_tokens = 0
+        self.buckets = [0] * len(getBucketLabels())
+
+
+    def add(self, content):
+        length = len(content.split())
+        tokens = self.count_tokens(content)
+
+        self.count += 1
+        self.min_length = length if self.min_length is None else min(self.min_length, length)
+        self.max_length = max(self.max_length, length)
+        self.exceeding_size += self.count_size(content) > self.max_size
+        # The limit that matters is the token window of the embedding model.
+        self.exceeding_tokens += tokens > self.max_tokens
+        self.buckets[getBucket(tokens)] += 1
+
+
+    def report(self):
+        print(f"Min Content Length: {self.min_length or 0}, Max Content Length: {self.max_length}")
+        print(f"Exceeding Chunk Size ({self.max_size} {self.unit}): {self.exceeding_size}/{self.count}")
+        print(f"Exceeding Embedding Window ({self.max_tokens} tokens): {self.exceeding_tokens}/{self.count}")
+        print("Chunk Token Lengths:", ", ".join(f"{label}: {count}" for label, count in zip(getBucketLabels(), self.buckets)))
+
+
+def buildLexicalIndex(folder):
+    """
+    Build the BM25 index (see src/LexicalIndex.py) of the chunks of every version, queried by the app next to
+    Cortex Search. The index in `folder` is only replaced once the new one is complete.
+    """
+    start_time = time.time()
+    build_folder = folder + ".tmp"
+    if os.path.exists(build_folder):
+        shutil.rmtree(build_folder)
+
+    count = LexicalIndex.build(build_folder, readRecords(staging_data), ["version"])
+
+    if os.path.exists(folder):
+        shutil.rmtree(folder)
+    os.rename(build_folder, folder)
+
+    print(f"Lexical index: {count} chunks, built in {time.time() - start_time:.1f}s")
+
+
+def processAndChunk(processFile, chunkMarkdown, getSource = None, full = False, config = None):
     """
     This will process & chunk the files extracted and save them to be directly imported into snowflake.
+
+    Only the files which changed since the last run (according to the manifest in the staging folder) are processed again.
+    Set `INGEST_WORKERS` to more than 1 to process the files of each version in that many processes.
+
+    The chunks are streamed to `<version>.jsonl` (see staging.py) as the files are processed, along with the
+    chunks added & removed by this run in `changes/<version>.jsonl`. The lexical index of all the versions is
+    built from the staging data at the end.
+
+    Args:
+        getSource (Callable[[str], str | None]): Optional, returns the path of the document a file takes its content from.
+        full (bool): Ignore the manifest and process every file.
+        config (dict): Optional, the chunking config (files are processed again when it changes).
     """
-    global chunk_count
-    global files_processed
+    workers = int(os.getenv("INGEST_WORKERS", "1"))
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    # The tokenizer sizes the chunks in tokens mode.
+    fingerprint = getFingerprint(config, processFile, chunkMarkdown, getTokenizer)
+    count_tokens = getTokenizer()
+    max_tokens = int(os.getenv("EMBEDDING_MAX_TOKENS", "512"))
+    manifest = loadManifest()
+    # The chunks are checked against the limit they were split with.
+    size_limit = {}
+    if config is not None:
+        size_limit = {"max_size": config["max_size"], "unit": config["unit"]}
+        if config["unit"] == "tokens":
+            size_limit["count_size"] = getTokenizer(config["tokenizer"])
+
+    if not os.path.exists(changes_dir):
+        os.mkdir(changes_dir)
+
     print("-" * 50)
-    for version in os.listdir(extracted_data):
-        chunk_count = 0
-        files_processed = 0
-        if not os.path.exists(os.path.join(output_dir, version)):
-            os.mkdir(os.path.join(output_dir, version))
-
-        print("For version:", version)
-        df = pd.DataFrame(columns=['path', 'title', 'description', 'content'])
-        df = traverseFolders(
-            os.path.join(extracted_data, version), df, version, processFile, chunkMarkdown
-        )
-        df['version'] = version
-        df.to_csv(f"{staging_data}/{version[1:]}.csv", index=False)
-        df = pd.read_csv(f"{staging_data}/{version[1:]}.csv")
-
-        df['length'] = df['content'].apply(lambda x: len(x.split()))
-        print(f"Min Content Length: {min(df['length'])}, Max Content Length: {max(df['length'])}")
-        print(f"Exceeding Chunk Size: {df[df['length'] > 385].shape[0]}/{df.shape[0]}")
-        print(f"Files processed: {files_processed}, Chunk Count: {chunk_count}")
-        print("-" * 50)
\ No newline at end of file
+    try:
+        for version in os.listdir(extracted_data):
+            if not os.path.exists(os.path.join(output_dir, version)):
+                os.mkdir(os.path.join(output_dir, version))
+
+            print("For version:", version)
+            staging_file = os.path.join(staging_data, f"{version[1:]}.jsonl")
+            changes_file = os.path.join(changes_dir, f"{version[1:]}.jsonl")
+            # Staging data written before it was streamed.
+            legacy_file = os.path.join(staging_data, f"{version[1:]}.csv")
+            previous_file = next((path for path in [staging_file, legacy_file] if os.path.exists(path)), None)
+            files = traverseFolders(os.path.join(extracted_data, version))
+
+            incremental = not full and previous_file is not None
+            previous = manifest.get(version, {}) if incremental else {}
+            entries = {
+                getRelativePath(path, version): getManifestEntry(path, getSource, fingerprint) for path in files
+            }
+
+            changed = [path for path in files if previous.get(getRelativePath(path, version)) != entries[getRelativePath(path, version)]]
+            removed = [relative_path for relative_path in previous.keys() if relative_path not in entries]
+            stale = set(getRelativePath(path, version) for path in changed) | set(removed)
+            args = (changed, repeat(version), repeat(processFile), repeat(chunkMarkdown))
+
+            if executor is not None:
+                results = executor.map(processPath, *args, chunksize=16)
+            else:
+                results = map(processPath, *args)
+
+            stats = ChunkStats(count_tokens, max_tokens, **size_limit)
+            added_count = removed_count = 0
+            with (
+                open(staging_file + ".tmp", 'w', encoding='utf-8') as staging_fp,
+                open(changes_file + ".tmp", 'w', encoding='utf-8') as changes_fp
+            ):
+                # Rows of the files that didn't change are carried over from the previous run.
+                if incremental:
+                    for row in readRows(previous_file):
+                        if row['path'] in stale:
+                            writeRow(changes_fp, {**row, 'op': 'remove'})
+                            removed_count += 1
+                        else:
+                            writeRow(staging_fp, row)
+                            stats.add(row['content'])
+
+                for path, file_rows in zip(changed, results):
+                    if file_rows is None:
+                        # Not saved in the manifest so it will be tried again in the next run.
+                        del entries[getRelativePath(path, version)]
+                        continue
+
+                    for row in file_rows:
+                        row['version'] = version
+                        writeRow(staging_fp, row)
+                        writeRow(changes_fp, {**row, 'op': 'add'})
+                        stats.add(row['content'])
+                        added_count += 1
+
+            os.replace(staging_file + ".tmp", staging_file)
+            os.replace(changes_file + ".tmp", changes_file)
+            if os.path.exists(legacy_file):
+                os.remove(legacy_file)
+
+            for relative_path in removed:
+                output_path = os.path.join(output_dir, version, relative_path)
+                if os.path.exists(output_path):
+                    os.remove(output_path)
+
+            manifest[version] = entries
+            saveManifest(manifest)
+
+            stats.report()
+            print(f"Files: {len(files)}, Processed: {len(changed)}, Removed: {len(removed)}, Chunk Count: {stats.count}")
+            print(f"Chunks Added: {added_count}, Chunks Removed: {removed_count}")
+            print("-" * 50)
+
+        buildLexicalIndex(os.getenv("LEXICAL_INDEX_PATH", "lexicalIndex"))
+    finally:
+        if executor is not None:
+            executor.shutdown()
@@ -1,7 +1,12 @@
 import os
 
+# TARGET_LAG of the search services in seconds, the time their results take to reflect the tables.
+docs_search_lag = 60
+posts_search_lag = 300
+
 # Queries for table containing Docs.
 create_docs_table_query = f"""CREATE TABLE IF NOT EXISTS {os.getenv('SNOWFLAKE_DOC_TABLE_NAME')} (
+    CHUNK_ID VARCHAR(64),
     RELATIVE_PATH STRING,
     FILE_CONTENT STRING,
     VERSION VARCHAR(15),
@@ -11,10 +16,13 @@ create_docs_table_query = f"""CREATE TABLE IF NOT EXISTS {os.getenv('SNOWFLAKE_D
 );
 """
 
+# Tables created before chunks had an identity.
+add_docs_chunk_id_query = f"ALTER TABLE {os.getenv('SNOWFLAKE_DOC_TABLE_NAME')} ADD COLUMN IF NOT EXISTS CHUNK_ID VARCHAR(64)"
+
 create_docs_search_query = f"""CREATE CORTEX SEARCH SERVICE IF NOT EXISTS {os.getenv('CORTEX_DOC_SEARCH_SERVICE')}
 ON FILE_CONTENT
 ATTRIBUTES RELATIVE_PATH, VERSION, TITLE, DESCRIPTION 
-TARGET_LAG = '60 seconds'
+TARGET_LAG = '{docs_search_lag} seconds'
 EMBEDDING_MODEL = '{os.getenv('CORTEX_EMBEDDING_MODEL')}'
 WAREHOUSE = COMPUTE_WH
 AS (
@@ -24,6 +32,48 @@ AS (
 )
 """
 
+# Content addressed storage of docs (DOC_STORAGE_MODE=dedup).
+# Every distinct chunk is stored (and embedded) once and the versions it belongs to are kept in a separate table.
+doc_content_table = f"{os.getenv('SNOWFLAKE_DOC_TABLE_NAME')}_CONTENT"
+doc_versions_table = f"{os.getenv('SNOWFLAKE_DOC_TABLE_NAME')}_VERSIONS"
+
+create_doc_content_table_query = f"""CREATE TABLE IF NOT EXISTS {doc_content_table} (
+    CONTENT_ID VARCHAR(64),
+    RELATIVE_PATH STRING,
+    FILE_CONTENT STRING,
+    TITLE VARCHAR(100),
+    DESCRIPTION VARCHAR(500),
+    PROCESSED_AT TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+create_doc_versions_table_query = f"""CREATE TABLE IF NOT EXISTS {doc_versions_table} (
+    CONTENT_ID VARCHAR(64),
+    VERSION VARCHAR(15)
+);
+"""
+
+# Content which is not part of any version anymore.
+delete_orphan_doc_content_query = f"""DELETE FROM {doc_content_table}
+WHERE CONTENT_ID NOT IN (SELECT CONTENT_ID FROM {doc_versions_table})
+"""
+
+# Same service as above, the version filter becomes a membership check on VERSIONS.
+create_dedup_docs_search_query = f"""CREATE CORTEX SEARCH SERVICE IF NOT EXISTS {os.getenv('CORTEX_DOC_SEARCH_SERVICE')}
+ON FILE_CONTENT
+ATTRIBUTES RELATIVE_PATH, VERSIONS, TITLE, DESCRIPTION 
+TARGET_LAG = '{docs_search_lag} seconds'
+EMBEDDING_MODEL = '{os.getenv('CORTEX_EMBEDDING_MODEL')}'
+WAREHOUSE = COMPUTE_WH
+AS (
+	SELECT
+		C.RELATIVE_PATH, C.FILE_CONTENT, ARRAY_AGG(V.VERSION) WITHIN GROUP (ORDER BY V.VERSION DESC) AS VERSIONS, C.TITLE, C.DESCRIPTION
+	FROM "{os.getenv('SNOWFLAKE_DB')}".{os.getenv('SNOWFLAKE_SCHEMA')}.{doc_content_table} C
+	JOIN "{os.getenv('SNOWFLAKE_DB')}".{os.getenv('SNOWFLAKE_SCHEMA')}.{doc_versions_table} V ON C.CONTENT_ID = V.CONTENT_ID
+	GROUP BY C.CONTENT_ID, C.RELATIVE_PATH, C.FILE_CONTENT, C.TITLE, C.DESCRIPTION
+)
+"""
+
 # Queries for table containing Discussion & Issues Data.
 create_dis_issue_table_query = f"""CREATE TABLE IF NOT EXISTS {os.getenv('SNOWFLAKE_POSTS_TABLE_NAME')} (
     TITLE VARCHAR(256),
@@ -37,7 +87,7 @@ create_dis_issue_table_query = f"""CREATE TABLE IF NOT EXISTS {os.getenv('SNOWFL
 create_dis_issue_search_query = f"""CREATE CORTEX SEARCH SERVICE IF NOT EXISTS {os.getenv('CORTEX_POSTS_SEARCH_SERVICE')}
 ON CONTENT
 ATTRIBUTES TITLE, URL, TYPE 
-TARGET_LAG = '5 minute'
+TARGET_LAG = '{posts_search_lag} seconds'
 EMBEDDING_MODEL = '{os.getenv('CORTEX_EMBEDDING_MODEL')}'
 WAREHOUSE = COMPUTE_WH
 AS (
@@ -1,19 +1,38 @@
 import os
-import requests
-import pandas as pd
+import sys
 import snowflake.connector
+from bulkLoad import bulkLoad
+from githubPosts import GithubPostReader
+from staging import listStaging, readRows, getText
+from deltaLoad import getChunkId, getContentId, syncRows, insertRows
 from queries import (
-    create_docs_table_query, create_docs_search_query, 
-    create_dis_issue_table_query, create_dis_issue_search_query
+    create_docs_table_query, create_docs_search_query, add_docs_chunk_id_query,
+    doc_content_table, doc_versions_table, create_doc_content_table_query, create_doc_versions_table_query,
+    delete_orphan_doc_content_query, create_dedup_docs_search_query,
+    create_dis_issue_table_query, create_dis_issue_search_query, docs_search_lag, posts_search_lag
 )
 
+# Allow the scripts to use the shared modules from src.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.ResultCache import invalidate_shared
+
 class SnowSetup():
-    def __init__(self):
-        self._conn = snowflake.connector.connect(
+    def __init__(self, conn = None, placeholder = "%s"):
+        """
+        Args:
+            conn: Optional DB-API connection to use instead of Snowflake (for example a local SQLite database, with placeholder "?").
+            placeholder (str): Parameter placeholder of the connection's driver.
+        """
+        self._conn = conn or snowflake.connector.connect(
             account=os.getenv("SNOWFLAKE_ACCOUNT"),
             user=os.getenv("SNOWFLAKE_USER"),
             password=os.getenv("SNOWFLAKE_PASSWORD")
         )
+        self._placeholder = placeholder
+        # Stage uploads only exist on Snowflake.
+        self._load_mode = os.getenv("LOAD_MODE", "bulk") if conn is None else "rows"
+        # versioned: a row per chunk per version, dedup: a row per distinct chunk + the versions it belongs to.
+        self._storage_mode = os.getenv("DOC_STORAGE_MODE", "versioned")
 
         self._cursor = self._conn.cursor()
 
@@ -34,6 +53,10 @@ class SnowSetup():
 
             print("Creating Snowflake Table")
             self._cursor.execute(create_docs_table_query)
+            self._cursor.execute(add_docs_chunk_id_query)
+            if self._storage_mode == "dedup":
+                self._cursor.execute(create_doc_content_table_query)
+                self._cursor.execute(create_doc_versions_table_query)
             self._cursor.execute(create_dis_issue_table_query)
 
             self.dbInit()
@@ -50,45 +73,111 @@ class SnowSetup():
 
     
     def insertDocs(self):
+        """
+        Sync the CHUNKS table with the staging data of every version. Only new chunks are inserted and chunks which
+        are not in the staging data anymore are deleted, so a failed load can simply be run again.
+        """
         print("-" * 50)
-        for file in os.listdir(os.getenv('CHUNK_CSV_OUTPUT')):
-            if not file.endswith('.csv'):
-                continue
+        staged = listStaging(os.getenv('CHUNK_CSV_OUTPUT'))
+        if self._storage_mode == "dedup":
+            self.syncDedupDocs(staged)
+        else:
+            for version, path in staged.items():
+                try:
+                    print(f"Syncing data into Snowflake Table for Version: {version}")
+                    self.syncDocs(version, path)
+                except Exception as e:
+                    print("Failed while Inserting Docs:", e)
+                
+                print("-" * 50)
 
-            try:
-                # If data for current data already exists.
-                print(f"Inserting data into Snowflake Table for Version: {file[:-4]}")
-                self._cursor.execute(f"SELECT version FROM CHUNKS WHERE version='v{file[:-4]}' LIMIT 1")
+        # Get started with cortex search
+        print("Creating Snowflake Search Service over Docs. This may take some time.")
+        self._cursor.execute(create_dedup_docs_search_query if self._storage_mode == "dedup" else create_docs_search_query)
+        # Cached search results of the app are stale now, and until the service has refreshed.
+        invalidate_shared(f"retrieval:{os.getenv('CORTEX_DOC_SEARCH_SERVICE')}", settle=docs_search_lag)
+    
 
-                if self._cursor.fetchone() is not None:
-                    print(f"Version v{file[:-4]} Data Already Present.")
-                    continue
-                
-                values = []
-                df = pd.read_csv(os.path.join(os.getenv('CHUNK_CSV_OUTPUT'), file))
+    def syncDocs(self, version, path):
+        """
+        Stream the staging file of the version into the CHUNKS table.
+        """
+        columns = ["CHUNK_ID", "RELATIVE_PATH", "FILE_CONTENT", "VERSION", "TITLE", "DESCRIPTION"]
+        total = 0
+
+        def getRows():
+            nonlocal total
+            ordinals = {}
+            for row in readRows(path):
+                total += 1
+                ordinal = ordinals.get(row['path'], 0)
+                ordinals[row['path']] = ordinal + 1
+                # Staging data written before chunks had an identity.
+                chunk_id = getText(row, 'chunk_id') or getChunkId(version, row['path'], ordinal, row['content'])
+                yield (chunk_id, row['path'], row['content'], version, getText(row, 'title'), getText(row, 'description'))
+
+        inserted, deleted = syncRows(
+            self._cursor, os.getenv('SNOWFLAKE_DOC_TABLE_NAME'), "CHUNK_ID", columns, getRows(),
+            scope=("VERSION", version), placeholder=self._placeholder,
+            insert=lambda new_rows: self.loadRows(os.getenv('SNOWFLAKE_DOC_TABLE_NAME'), columns, new_rows)
+        )
+        print(f"Version {version}: {inserted} chunks inserted, {deleted} chunks deleted, {total - inserted} unchanged.")
 
-                command = f"INSERT INTO {os.getenv('SNOWFLAKE_DOC_TABLE_NAME')} (RELATIVE_PATH, FILE_CONTENT, VERSION, TITLE, DESCRIPTION) VALUES (%s, %s, %s, %s, %s)"
-                
-                for idx, row in df.iterrows():
-                    values.append((str(row['path']), str(row['content']), str(row['version']), str(row['title']), str(row['description'])))
 
-                    if idx > 0 and idx % 500 == 0:
-                        print(f"Running Query for idx: {idx - 500}-{idx}")
-                        self._cursor.executemany(command, values)
-                        values = []
-                
-                if len(values) > 0:
-                    print(f"Running for remaining {len(values)} values.")
-                    self._cursor.executemany(command, values)
+    def syncDedupDocs(self, staged):
+        """
+        Content addressed sync (DOC_STORAGE_MODE=dedup). A chunk that is the same in many versions is stored once
+        in the content table and each version only adds a (CONTENT_ID, VERSION) row.
+
+        Args:
+            staged (dict): Staging file of each version.
+        """
+        content_columns = ["CONTENT_ID", "RELATIVE_PATH", "FILE_CONTENT", "TITLE", "DESCRIPTION"]
+        version_columns = ["CONTENT_ID", "VERSION"]
+        total = 0
+        distinct = set()
+
+        def getContentRows(path):
+            for row in readRows(path):
+                title, description = getText(row, 'title'), getText(row, 'description')
+                yield getContentId(row['path'], title, description, row['content']), row['path'], row['content'], title, description
+
+        def getContents():
+            nonlocal total
+            for version, path in staged.items():
+                try:
+                    for row in getContentRows(path):
+                        total += 1
+                        if row[0] not in distinct:
+                            distinct.add(row[0])
+                            yield row
+                except Exception as e:
+                    print(f"Failed while reading Docs for Version {version}:", e)
+
+        # New content first, so the versions never point to content that isn't there.
+        inserted, _ = syncRows(
+            self._cursor, doc_content_table, "CONTENT_ID", content_columns, getContents(),
+            placeholder=self._placeholder, delete=False,
+            insert=lambda new_rows: self.loadRows(doc_content_table, content_columns, new_rows)
+        )
+        print(f"Chunks: {total} over {len(staged)} versions, Distinct: {len(distinct)} ({total / max(len(distinct), 1):.1f}x less)")
+        print(f"{inserted} chunks inserted, {len(distinct) - inserted} already stored.")
+
+        for version, path in staged.items():
+            try:
+                inserted, deleted = syncRows(
+                    self._cursor, doc_versions_table, "CONTENT_ID", version_columns,
+                    ((row[0], version) for row in getContentRows(path)),
+                    scope=("VERSION", version), placeholder=self._placeholder,
+                    insert=lambda new_rows: self.loadRows(doc_versions_table, version_columns, new_rows)
+                )
+                print(f"Version {version}: {inserted} chunks added, {deleted} chunks removed.")
             except Exception as e:
-                print("Failed while Inserting Docs:", e)
-            
-            print("-" * 50)
+                print(f"Failed while Inserting Docs for Version {version}:", e)
+
+        self._cursor.execute(delete_orphan_doc_content_query)
+        print("-" * 50)
 
-        # Get started with cortex search
-        print("Creating Snowflake Search Service over Docs. This may take some time.")
-        self._cursor.execute(create_docs_search_query)
-    
 
     def insertPosts(self):
         self.processGithubPost("Issue")
@@ -96,103 +185,67 @@ class SnowSetup():
         
         print("Creating Snowflake Search Service over Posts. This may take some time.")
         self._cursor.execute(create_dis_issue_search_query)
+        invalidate_shared(f"retrieval:{os.getenv('CORTEX_POSTS_SEARCH_SERVICE')}", settle=posts_search_lag)
 
     
     def processGithubPost(self, type):
-        if type not in ["Issue", "Discussion"]:
-            raise ValueError("Invalid content type. Must be 'Issue' or 'Discussion'")
-        
-        print(f"Will try to insert {type}s")
-
-        url = "https://api.github.com/graphql"
-
-        query = f"""
-            query($query: String!, $cursor: String) {{
-                search(query: $query, type: { type.upper() }, first: 10, after: $cursor) {{
-                    discussionCount
-                    pageInfo {{
-                        hasNextPage
-                        endCursor
-                    }}
-                    nodes {{
-                        ... on { type } {{
-                            title
-                            url
-                            body
-                            updatedAt
-                        }}
-                    }}
-                }}
-            }}
         """
-        
-        headers = {
-            "Authorization": f"Bearer {os.getenv('GITHUB_TOKEN')}",
-            "Content-Type": "application/json"
-        }
-
-        posts = []
-        cursor = None
-        has_next_page = True
-
-        updated_after = self._cursor.execute(
-            f"SELECT TO_CHAR(COALESCE(MAX(UPDATED_AT), '2024-01-01'::TIMESTAMP_NTZ), 'YYYY-MM-DD') FROM POSTS WHERE TYPE='{type}' LIMIT 1"
-        ).fetchone()[0]
+        Stream the issues/discussions from GitHub into the posts table. Pages are loaded as they arrive
+        (every `POSTS_LOAD_BATCH` rows) and an interrupted sync resumes from the last loaded page.
+        """
+        reader = GithubPostReader(type)
+        print(f"Will try to insert {type}s")
 
-        condition = "state:closed interactions:>1" if type == "Issue" else "is:answered"
-        print(f"Inserting {type}s updated_after: {updated_after} with condition: {condition}")
+        checkpoint = reader.loadCheckpoint()
+        if checkpoint is not None:
+            search_query, cursor = checkpoint["query"], checkpoint["cursor"]
+            print(f"Resuming {type}s for query: {search_query}")
+        else:
+            # Plain SQL, so it also runs on a local SQLite database.
+            self._cursor.execute(
+                f"SELECT MAX(UPDATED_AT) FROM {os.getenv('SNOWFLAKE_POSTS_TABLE_NAME')} WHERE TYPE = {self._placeholder}", (type,)
+            )
+            last_updated = self._cursor.fetchone()[0]
+            updated_after = "2024-01-01" if last_updated is None else str(last_updated)[:10]
+
+            condition = "state:closed interactions:>1" if type == "Issue" else "is:answered"
+            print(f"Inserting {type}s updated_after: {updated_after} with condition: {condition}")
+            search_query, cursor = f"repo:{os.getenv('REPO_NAME')} updated:>={updated_after} {condition}", None
+
+        columns = ["TITLE", "URL", "CONTENT", "TYPE", "UPDATED_AT"]
+        batch_size = int(os.getenv("POSTS_LOAD_BATCH", "1000"))
+        values = []
+        inserted = 0
 
         try:
-            while has_next_page:
-                search_query = f"repo:{os.getenv('REPO_NAME')} updated:>={updated_after} {condition}"
-                variables = {
-                    "query": search_query,
-                    "cursor": cursor
-                }
-                response = requests.post(
-                    url, 
-                    json = {
-                        "query": query,
-                        "variables": variables
-                    }, 
-                    headers=headers
+            for nodes, cursor in reader.pages(search_query, cursor):
+                values.extend(
+                    (str(row['title']), str(row['url']), str(row['body']), type, str(row['updatedAt'])) for row in nodes
                 )
-                if response.status_code != 200:
-                    raise Exception(f"Query failed: {response.status_code}, {response.text}")
 
-                data = response.json()
-                search_data = data["data"]["search"]
-                posts.extend(search_data["nodes"])
+                if len(values) >= batch_size:
+                    self.loadRows(os.getenv('SNOWFLAKE_POSTS_TABLE_NAME'), columns, values)
+                    reader.saveCheckpoint(search_query, cursor)
+                    inserted += len(values)
+                    values = []
 
-                # Pagination handling
-                has_next_page = search_data["pageInfo"]["hasNextPage"]
-                cursor = search_data["pageInfo"]["endCursor"]
+            self.loadRows(os.getenv('SNOWFLAKE_POSTS_TABLE_NAME'), columns, values)
+            inserted += len(values)
+            reader.clearCheckpoint()
         except Exception as e:
-            print(f"Failed when trying to read Repo {type}: {e}")
-
-        print(f"Found {len(posts)} {type}s to insert.")
-        values = []
-        command = f"INSERT INTO {os.getenv('SNOWFLAKE_POSTS_TABLE_NAME')} (TITLE, URL, CONTENT, TYPE, UPDATED_AT) VALUES (%s, %s, %s, %s, %s)"
+            print(f"Failed when trying to sync {type}s (run again to resume): {e}")
 
-        insertion_group_size = 100
-        try:
-            for idx, row in enumerate(posts):
-                if len(row.keys()) == 0:
-                    continue
+        print(f"Inserted {inserted} {type}s.")
 
-                values.append((str(row['title']), str(row['url']), str(row['body']), type, str(row['updatedAt'])))
 
-                if idx > 0 and idx % insertion_group_size == 0:
-                    print(f"Running Query for idx: {idx - insertion_group_size}-{idx}")
-                    self._cursor.executemany(command, values)
-                    values = []
-
-            if len(values) > 0:
-                print(f"Running for remaining {len(values)} values.")
-                self._cursor.executemany(command, values)
-        
-        except Exception as e:
-            print(f"Failed when trying to insert {type}s into table: {e}")
+    def loadRows(self, table, columns, rows):
+        """
+        Insert the rows with a stage upload + COPY INTO (LOAD_MODE=bulk) or with executemany (LOAD_MODE=rows).
+        """
+        if self._load_mode == "bulk":
+            bulkLoad(self._cursor, table, columns, rows)
+        else:
+            insertRows(self._cursor, table, columns, rows, self._placeholder)
 
 
     def __del__(self):
@@ -0,0 +1,62 @@
+"""
+Staging data of the processed docs: one file per version (`<version>.jsonl`) with one JSON object per chunk.
+
+Rows are appended while the docs are processed and read back one at a time, so neither processing nor loading
+needs a whole version in memory. Staging folders written before this (`<version>.csv`) can still be read.
+"""
+import os
+import json
+import pandas as pd
+
+
+def writeRow(fp, row):
+    fp.write(json.dumps(row, ensure_ascii=False, default=str) + "\n")
+
+
+def readRows(path, batch_size = 1000):
+    """
+    Yields the rows (dict) of a staging file. CSV files are read `batch_size` rows at a time.
+    """
+    if path.endswith(".csv"):
+        for df in pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=batch_size):
+            yield from df.to_dict('records')
+        return
+
+    with open(path, 'r', encoding='utf-8') as fp:
+        for line in fp:
+            if line.strip():
+                yield json.loads(line)
+
+
+def getText(row, key):
+    """
+    Value of the column as text (like it was read from the CSV files).
+    """
+    value = row.get(key)
+    return "" if value is None else str(value)
+
+
+def listStaging(folder):
+    """
+    Returns:
+        dict: Staging file of each version (the JSON lines file if there are both).
+    """
+    files = {}
+    for file in sorted(os.listdir(folder)):
+        name, extension = os.path.splitext(file)
+        if extension == ".jsonl" or (extension == ".csv" and f"v{name}" not in files):
+            files[f"v{name}"] = os.path.join(folder, file)
+
+    return files
+
+
+def readRecords(folder):
+    """
+    Yields the chunks of every version as search records (the columns of the docs search service).
+    """
+    for version, path in listStaging(folder).items():
+        for row in readRows(path):
+            yield {
+                "title": getText(row, 'title'), "relative_path": row['path'], "version": version,
+                "file_content": row['content'], "description": getText(row, 'description')
+            }
@@ -0,0 +1,56 @@
+"""
+Token counting for chunk sizing. The tokenizer is picked with `CHUNK_TOKENIZER`:
+    - whitespace: counts whitespace separated words (default, no extra dependency).
+    - path to a tokenizer.json: HuggingFace tokenizer of the embedding model (needs the `tokenizers` package).
+    - tiktoken:<encoding>: a tiktoken encoding, for example tiktoken:cl100k_base (needs the `tiktoken` package).
+
+If the configured tokenizer can't be loaded we fall back to whitespace.
+"""
+import os
+from functools import lru_cache
+
+
+def countWords(text):
+    return len(text.split())
+
+
+@lru_cache(maxsize=None)
+def getTokenizer(name = None):
+    """
+    Returns:
+        Callable[[str], int]: Function returning the number of tokens in a text.
+    """
+    name = name or os.getenv("CHUNK_TOKENIZER", "whitespace")
+    if name == "whitespace":
+        return countWords
+
+    try:
+        if name.startswith("tiktoken:"):
+            import tiktoken
+
+            encoding = tiktoken.get_encoding(name[len("tiktoken:"):])
+            return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+        from tokenizers import Tokenizer
+
+        tokenizer = Tokenizer.from_file(name)
+        return lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids)
+    except Exception as e:
+        print(f"Could not load tokenizer '{name}', falling back to whitespace. Error: {e}")
+        return countWords
+
+
+# Buckets of the chunk length histograms, bucket i holds lengths in (edges[i - 1], edges[i]] and the last one everything above.
+histogram_edges = (64, 128, 256, 384, 512, 768, 1024)
+
+
+def getBucket(length, edges = histogram_edges):
+    idx = 0
+    while idx < len(edges) and length > edges[idx]:
+        idx += 1
+
+    return idx
+
+
+def getBucketLabels(edges = histogram_edges):
+    return [f"<={edge}" for edge in edges] + [f">{edges[-1]}"]
@@ -0,0 +1,111 @@
+import os
+import json
+import mmap
+import numpy as np
+from functools import reduce
+from typing import Iterable, List, Optional
+
+
+class ChunkStore:
+    """
+    Chunk records of a local index (see `scripts/buildLocalIndex.py`) kept on disk and read through mmap.
+
+    Files in the folder:
+        records.jsonl: One JSON object per chunk.
+        offsets.npy: Byte offset of every record (plus the end of the file).
+        attributes.json: Distinct values of every filterable attribute.
+        <attribute>.npy: Index (into the values above) of the attribute of every chunk.
+
+    The boolean mask of every attribute value is computed once on load, so filters are a few numpy operations.
+    """
+    # The dedup storage filters on the list of versions, locally every record has a single version.
+    ALIASES = {"versions": "version"}
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self._offsets = np.load(os.path.join(folder, "offsets.npy"), mmap_mode="r")
+
+        self._file = open(os.path.join(folder, "records.jsonl"), "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+        with open(os.path.join(folder, "attributes.json"), "r", encoding="utf-8") as fp:
+            attributes = json.load(fp)
+
+        self._masks = {}
+        for attribute, values in attributes.items():
+            ids = np.load(os.path.join(folder, f"{attribute}.npy"))
+            self._masks[attribute] = {value: ids == idx for idx, value in enumerate(values)}
+
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+
+    def get(self, idx: int) -> dict:
+        return json.loads(self._data[int(self._offsets[idx]):int(self._offsets[idx + 1])])
+
+
+    def mask(self, filter_obj) -> Optional[np.ndarray]:
+        """
+        Boolean mask of the chunks matching a Cortex Search style filter (@eq, @contains, @and, @or, @not).
+
+        Returns:
+            np.ndarray | None: None if nothing is filtered out.
+        """
+        if not filter_obj:
+            return None
+
+        (operator, value), = filter_obj.items()
+        if operator == "@and":
+            return reduce(np.logical_and, [self._full_mask(item) for item in value])
+        if operator == "@or":
+            return reduce(np.logical_or, [self._full_mask(item) for item in value])
+        if operator == "@not":
+            return ~self._full_mask(value)
+        if operator in ["@eq", "@contains"]:
+            (column, target), = value.items()
+            attribute = self.ALIASES.get(column, column)
+            if attribute not in self._masks:
+                raise ValueError(f"Can't filter on '{column}', the local index only has: {list(self._masks.keys())}")
+
+            mask = self._masks[attribute].get(target)
+            return mask if mask is not None else np.zeros(len(self), dtype=bool)
+
+        raise ValueError(f"Unsupported filter operator: {operator}")
+
+
+    def _full_mask(self, filter_obj) -> np.ndarray:
+        mask = self.mask(filter_obj)
+        return np.ones(len(self), dtype=bool) if mask is None else mask
+
+
+    @staticmethod
+    def write(folder: str, records: Iterable[dict], attributes: List[str]) -> int:
+        """
+        Write the records (streamed) to the folder.
+
+        Returns:
+            int: Number of records written.
+        """
+        os.makedirs(folder, exist_ok=True)
+        offsets = [0]
+        values = {attribute: {} for attribute in attributes}
+        ids = {attribute: [] for attribute in attributes}
+
+        with open(os.path.join(folder, "records.jsonl"), "wb") as fp:
+            for record in records:
+                for attribute in attributes:
+                    ids[attribute].append(values[attribute].setdefault(record.get(attribute), len(values[attribute])))
+
+                line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+                fp.write(line)
+                offsets.append(offsets[-1] + len(line))
+
+        np.save(os.path.join(folder, "offsets.npy"), np.array(offsets, dtype=np.int64))
+        for attribute in attributes:
+            np.save(os.path.join(folder, f"{attribute}.npy"), np.array(ids[attribute], dtype=np.int32))
+        with open(os.path.join(folder, "attributes.json"), "w", encoding="utf-8") as fp:
+            json.dump({attribute: list(values[attribute].keys()) for attribute in attributes}, fp)
+
+        return len(offsets) - 1
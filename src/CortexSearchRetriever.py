@@ -1,32 +1,50 @@
-import os
 import json
 from typing import List
-from snowflake.core import Root
-from snowflake.snowpark import Session
+from src.ServiceRegistry import registry
+from src.ResultCache import get_retrieval_cache, make_key, normalize_query
 
 
 class CortexSearchRetriever:
-    def __init__(self, session: Session, service: str, columns: List[str], top_k: int = 4):
-        self._session = session
-        self._service = service
+    def __init__(self, service: str, columns: List[str], top_k: int = 4, cache = None):
+        """
+        Args:
+            cache: Anything with `get(key)` & `set(key, value)` (see `ResultCache`). Defaults to the process wide cache for this service.
+        """
+        self._service_name = service
         self._top_k = top_k
         self._columns = columns
-
-        root = Root(self._session)
-        self._service = (
-            root.databases[os.getenv("SNOWFLAKE_DB")]
-            .schemas[os.getenv("SNOWFLAKE_SCHEMA")]
-            .cortex_search_services[service]
-        )
+        self._cache = cache if cache is not None else get_retrieval_cache(service)
 
 
-    def retrieve(self, query: str, filter_obj = {}) -> List[str]:
-        response = self._service.search(
+    def _search(self, query: str, filter_obj):
+        # The handle is resolved once per process by the registry.
+        response = registry.get_search_service(self._service_name).search(
             filter=filter_obj,
             query=query,
             columns=self._columns,
             limit=self._top_k,
         )
 
-        response = json.loads(response.to_json())
-        return response["results"]
\ No newline at end of file
+        return json.loads(response.to_json())
+
+
+    def retrieve(self, query: str, filter_obj = {}) -> List[str]:
+        key = None
+        if self._cache is not None:
+            key = make_key(self._service_name, normalize_query(query), filter_obj, self._columns, self._top_k)
+            results = self._cache.get(key)
+            if results is not None:
+                return results
+
+        try:
+            response = self._search(query, filter_obj)
+        except Exception as e:
+            # Session or handle may have gone stale, re-resolve them and try once more.
+            print(f"Search on {self._service_name} failed, reconnecting. Error: {e}")
+            registry.reset()
+            response = self._search(query, filter_obj)
+
+        if key is not None:
+            self._cache.set(key, response["results"])
+
+        return response["results"]
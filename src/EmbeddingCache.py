@@ -0,0 +1,105 @@
+import os
+import re
+import hashlib
+import threading
+import numpy as np
+from functools import lru_cache
+from typing import List, Optional
+
+
+class EmbeddingCache:
+    """
+    Disk backed cache of the embeddings of a model, keyed by the sha256 of the text.
+
+    Every (model, dims) has its own append-only file of fixed size records (32 bytes of digest followed by the
+    float32 vector) which is memory mapped, the row of every digest is kept in memory and is read from the
+    file on load. Records appended by other processes are picked up on the next lookup.
+    """
+    def __init__(self, folder: str, model_name: str, dims: int):
+        self.model_name = model_name
+        self.dims = dims
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(folder, exist_ok=True)
+        name = re.sub(r"[^\w.-]", "_", model_name)
+        self.path = os.path.join(folder, f"{name}-{dims}.bin")
+        # Raw bytes (a "S32" field would drop the trailing NUL bytes of a digest).
+        self._dtype = np.dtype([("key", "u1", (32,)), ("vector", "<f4", (dims,))])
+
+        self._lock = threading.Lock()
+        self._rows = {}
+        self._records = None
+        self._size = 0
+        with open(self.path, "ab"):
+            pass
+
+
+    @staticmethod
+    def digest(text: str) -> bytes:
+        return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+    def _refresh(self):
+        # Only complete records count (a record can be half written by another process).
+        size = os.path.getsize(self.path) // self._dtype.itemsize * self._dtype.itemsize
+        if size == self._size:
+            return
+
+        records = np.memmap(self.path, dtype=self._dtype, mode="r", shape=(size // self._dtype.itemsize,))
+        keys = np.asarray(records["key"][self._size // self._dtype.itemsize:])
+        for row, key in enumerate(keys, start=self._size // self._dtype.itemsize):
+            self._rows.setdefault(key.tobytes(), row)
+        self._records = records
+        self._size = size
+
+
+    def get_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        Returns the cached embedding of every text (None for the misses).
+        """
+        digests = [self.digest(text) for text in texts]
+        with self._lock:
+            self._refresh()
+            rows = [self._rows.get(digest) for digest in digests]
+            embeddings = [None if row is None else self._records[row]["vector"].tolist() for row in rows]
+
+            hits = sum(row is not None for row in rows)
+            self.hits += hits
+            self.misses += len(rows) - hits
+
+        return embeddings
+
+
+    def add_many(self, texts: List[str], embeddings: List[List[float]]):
+        records = np.zeros(len(texts), dtype=self._dtype)
+        records["key"] = np.frombuffer(b"".join(self.digest(text) for text in texts), dtype=np.uint8).reshape(-1, 32)
+        records["vector"] = np.asarray(embeddings, dtype=np.float32).reshape(len(texts), self.dims)
+
+        with self._lock:
+            # A single append, so the records of concurrent writers don't interleave.
+            with open(self.path, "ab") as fp:
+                fp.write(records.tobytes())
+
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "model": self.model_name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "size": len(self._rows),
+        }
+
+
+@lru_cache(maxsize=None)
+def get_embedding_cache(model_name: str, dims: int):
+    """
+    Process wide embedding cache of a model. Returns None if caching is disabled (empty EMBEDDING_CACHE_PATH).
+    """
+    folder = os.getenv("EMBEDDING_CACHE_PATH", "embeddingCache")
+    if not folder:
+        return None
+
+    return EmbeddingCache(folder, model_name, dims)
@@ -0,0 +1,162 @@
+import os
+import re
+import json
+import math
+import numpy as np
+from array import array
+from typing import Iterable, List, Optional
+from src.ChunkStore import ChunkStore
+
+# Identifiers like `next/image`, `getStaticPaths` or `revalidatePath()` are kept whole (their parts are indexed too).
+token_pattern = re.compile(r"[a-z0-9_$]+(?:[./\-][a-z0-9_$]+)*")
+part_pattern = re.compile(r"[./\-]")
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in token_pattern.findall(text.lower()):
+        tokens.append(token)
+        if part_pattern.search(token):
+            tokens.extend(part for part in part_pattern.split(token) if part)
+
+    return tokens
+
+
+def reciprocal_rank_fusion(result_lists: List[List[dict]], top_k: int, k: int = 60, key_columns = ("relative_path", "file_content")) -> List[dict]:
+    """
+    Merge ranked result lists: every result scores 1 / (k + rank) in each list it is in.
+    Results are identified by `key_columns`, the first list a result appears in provides it.
+    """
+    scores = {}
+    results = {}
+    for result_list in result_lists:
+        for rank, result in enumerate(result_list):
+            key = tuple(result.get(column) for column in key_columns)
+            scores[key] = scores.get(key, 0) + 1 / (k + rank + 1)
+            results.setdefault(key, result)
+
+    ranked = sorted(scores.keys(), key=lambda key: scores[key], reverse=True)
+    return [results[key] for key in ranked[:top_k]]
+
+
+class LexicalIndex:
+    """
+    BM25 index over the chunk content, built by `processAndChunk` from the staging data.
+
+    Files in the folder (next to the `ChunkStore` of the chunks):
+        terms.json: The vocabulary (term -> term id).
+        postings_offsets.npy: Start of the postings of every term (plus the end).
+        postings_chunks.npy, postings_counts.npy: Chunk ids (int32) & term frequencies (uint16) of all the postings, grouped by term.
+        lengths.npy: Number of tokens of every chunk.
+
+    The arrays are memory mapped, loading only reads the vocabulary.
+    """
+    def __init__(self, folder: str, columns: List[str], top_k: int = 4, k1: float = 1.2, b: float = 0.75):
+        self._store = ChunkStore(folder)
+        self._columns = columns
+        self._top_k = top_k
+        self._k1 = k1
+        self._b = b
+
+        with open(os.path.join(folder, "terms.json"), "r", encoding="utf-8") as fp:
+            self._terms = json.load(fp)
+        self._offsets = np.load(os.path.join(folder, "postings_offsets.npy"), mmap_mode="r")
+        self._chunks = np.load(os.path.join(folder, "postings_chunks.npy"), mmap_mode="r")
+        self._counts = np.load(os.path.join(folder, "postings_counts.npy"), mmap_mode="r")
+        # Length normalization of every chunk (the part of the BM25 denominator that doesn't depend on the term).
+        lengths = np.load(os.path.join(folder, "lengths.npy")).astype(np.float32)
+        average_length = float(lengths.mean()) if len(lengths) else 1.0
+        self._norms = k1 * (1 - b + b * lengths / max(average_length, 1.0))
+
+
+    @classmethod
+    def load(cls, columns: List[str], top_k: int = 4, folder: Optional[str] = None):
+        """
+        Returns:
+            LexicalIndex | None: None if the index (LEXICAL_INDEX_PATH) wasn't built.
+        """
+        folder = folder or os.getenv("LEXICAL_INDEX_PATH", "lexicalIndex")
+        if not os.path.exists(os.path.join(folder, "terms.json")):
+            return None
+
+        return cls(folder, columns, top_k)
+
+
+    def retrieve(self, query: str, filter_obj = {}) -> List[dict]:
+        scores = np.zeros(len(self._store), dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self._terms.get(term)
+            if term_id is None:
+                continue
+
+            start, end = int(self._offsets[term_id]), int(self._offsets[term_id + 1])
+            chunks = self._chunks[start:end]
+            counts = self._counts[start:end].astype(np.float32)
+            idf = math.log(1 + (len(scores) - (end - start) + 0.5) / ((end - start) + 0.5))
+            scores[chunks] += idf * counts * (self._k1 + 1) / (counts + self._norms[chunks])
+
+        mask = self._store.mask(filter_obj)
+        if mask is not None:
+            scores[~mask] = 0
+
+        matched = np.flatnonzero(scores)
+        if len(matched) == 0:
+            return []
+
+        k = min(self._top_k, len(matched))
+        top = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        top = top[np.argsort(-scores[top], kind="stable")]
+
+        return [self._result(self._store.get(idx)) for idx in top]
+
+
+    def _result(self, record: dict) -> dict:
+        return {
+            column: [record.get("version")] if column == "versions" else record.get(column) for column in self._columns
+        }
+
+
+    @staticmethod
+    def build(folder: str, records: Iterable[dict], attributes: List[str]) -> int:
+        """
+        Build the index of the records (streamed, see `ChunkStore.write`) into the folder.
+
+        Returns:
+            int: Number of chunks indexed.
+        """
+        terms = {}
+        term_ids = array("i")
+        chunk_ids = array("i")
+        counts = array("H")
+        lengths = array("i")
+
+        def getRecords():
+            for record in records:
+                tokens = tokenize(record.get("file_content") or "")
+                frequencies = {}
+                for token in tokens:
+                    frequencies[token] = frequencies.get(token, 0) + 1
+
+                for token, count in frequencies.items():
+                    term_ids.append(terms.setdefault(token, len(terms)))
+                    chunk_ids.append(len(lengths))
+                    counts.append(min(count, 65535))
+                lengths.append(len(tokens))
+                yield record
+
+        count = ChunkStore.write(folder, getRecords(), attributes)
+
+        # Group the postings by term (chunks stay in order within a term).
+        term_ids = np.frombuffer(term_ids, dtype=np.int32) if len(term_ids) else np.zeros(0, dtype=np.int32)
+        order = np.argsort(term_ids, kind="stable")
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(term_ids, minlength=len(terms)))
+
+        np.save(os.path.join(folder, "postings_offsets.npy"), offsets)
+        np.save(os.path.join(folder, "postings_chunks.npy"), np.asarray(chunk_ids, dtype=np.int32)[order])
+        np.save(os.path.join(folder, "postings_counts.npy"), np.asarray(counts, dtype=np.uint16)[order])
+        np.save(os.path.join(folder, "lengths.npy"), np.asarray(lengths, dtype=np.int32))
+        with open(os.path.join(folder, "terms.json"), "w", encoding="utf-8") as fp:
+            json.dump(terms, fp)
+
+        return count
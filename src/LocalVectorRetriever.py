@@ -0,0 +1,85 @@
+import os
+import numpy as np
+from typing import Callable, List, Optional
+from llama_index.core import Settings
+from src.ChunkStore import ChunkStore
+
+
+class LocalVectorRetriever:
+    """
+    In-process alternative to `CortexSearchRetriever` with the same `retrieve(query, filter_obj)` contract.
+
+    Searches the chunk embeddings built by `scripts/buildLocalIndex.py`: a normalized float32 matrix which is
+    memory mapped, scored with a single dot product over the chunks that pass the filter (precomputed masks).
+    Only the query is embedded per call, with the same model the index was built with.
+
+    By default the query is embedded with `Settings.embed_model` (Cortex, unless the embedding is cached), so the
+    search still needs Snowflake. Offline use needs a local query embedder (`embed`) producing the same vectors.
+    """
+    def __init__(self, folder: str, columns: List[str], top_k: int = 4, embed: Optional[Callable[[str], List[float]]] = None):
+        """
+        Args:
+            embed: Optional, returns the embedding of a query. Defaults to `Settings.embed_model`.
+        """
+        self._store = ChunkStore(folder)
+        self._embeddings = np.load(os.path.join(folder, "embeddings.npy"), mmap_mode="r")
+        self._columns = columns
+        self._top_k = top_k
+        self._embed = embed
+
+
+    @classmethod
+    def load(cls, columns: List[str], top_k: int = 4, folder: Optional[str] = None):
+        """
+        Returns:
+            LocalVectorRetriever | None: None if the local index (LOCAL_INDEX_PATH) wasn't built.
+        """
+        folder = folder or os.getenv("LOCAL_INDEX_PATH", "localIndex")
+        if not os.path.exists(os.path.join(folder, "embeddings.npy")):
+            return None
+
+        return cls(folder, columns, top_k)
+
+
+    def embed_query(self, query: str) -> np.ndarray:
+        vector = np.asarray(
+            self._embed(query) if self._embed is not None else Settings.embed_model.get_query_embedding(query),
+            dtype=np.float32
+        )
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+
+    def retrieve(self, query: str, filter_obj = {}, embedding: Optional[List[float]] = None) -> List[dict]:
+        """
+        Args:
+            embedding: Optional, the embedding of the query if it was already computed.
+        """
+        mask = self._store.mask(filter_obj)
+        candidates = np.flatnonzero(mask) if mask is not None else None
+        if candidates is not None and len(candidates) == 0:
+            return []
+
+        embeddings = self._embeddings if candidates is None else self._embeddings[candidates]
+        if embedding is not None:
+            vector = np.asarray(embedding, dtype=np.float32)
+            vector /= max(float(np.linalg.norm(vector)), 1e-12)
+        else:
+            vector = self.embed_query(query)
+        scores = embeddings @ vector
+
+        k = min(self._top_k, len(scores))
+        if k == 0:
+            return []
+
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        ids = top if candidates is None else candidates[top]
+
+        return [self._result(self._store.get(idx)) for idx in ids]
+
+
+    def _result(self, record: dict) -> dict:
+        # Same shape as the Cortex Search results (only the requested columns).
+        return {
+            column: [record.get("version")] if column == "versions" else record.get(column) for column in self._columns
+        }
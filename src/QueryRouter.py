@@ -0,0 +1,150 @@
+import os
+import re
+import importlib
+import threading
+from collections import Counter
+from typing import Callable, List, Optional
+
+# "v14", "version 14", "next 14", "Next.js 14.2", "nextjs@15" or a bare "13.5"
+version_pattern = re.compile(
+    r"\b(?:(?:v|version\s*|next(?:\.?js)?(?:\s*|@))(\d+(?:\.\d+)*)|(\d+\.\d+(?:\.\d+)*))\b", re.IGNORECASE
+)
+comparison_pattern = re.compile(
+    r"\b(?:vs|versus|compare[ds]?|comparison|differen(?:ce|ces|t)|between|migrat(?:e|ing|ion)|upgrad(?:e|ing)|instead of|or)\b",
+    re.IGNORECASE
+)
+code_pattern = re.compile(r"```|`[^`\n]+`|[{};]\s*$|^\s*(?:import|export|const|function)\b", re.MULTILINE)
+# Words that only make sense with the earlier messages.
+reference_pattern = re.compile(
+    r"\b(?:it|its|this|that|these|those|they|them|above|previous|same|again|earlier|mentioned)\b", re.IGNORECASE
+)
+
+
+def mentioned_versions(query: str, versions: List[str]):
+    """
+    Every mention is matched on the parts it gives ("14" matches every v14.x.y, "14.2" only the v14.2.y) and resolves
+    to the first match, the newest as `versions` are newest first.
+
+    Returns:
+        Tuple[List[str], int]: The available versions the question mentions & the number of other versions it mentions.
+    """
+    parts = [(version, version.lstrip("vV").split(".")) for version in versions]
+    available, unknown = [], 0
+    for match in version_pattern.finditer(query):
+        mention = (match.group(1) or match.group(2)).split(".")
+        version = next((version for version, version_parts in parts if version_parts[:len(mention)] == mention), None)
+        if version is None:
+            unknown += 1
+        elif version not in available:
+            available.append(version)
+
+    return available, unknown
+
+
+def load_classifier(path: Optional[str]):
+    """
+    Load the classifier hook from a `module:function` path (QUERY_ROUTER_CLASSIFIER).
+    The function gets the features of a question and returns the probability that it needs the decomposition.
+    """
+    if not path:
+        return None
+
+    module, name = path.split(":")
+    return getattr(importlib.import_module(module), name)
+
+
+class QueryRouter:
+    """
+    Local stage in front of the LLM decomposition: simple questions are sent to the retrieval as they are.
+
+    A question is decomposed when it mentions more than one version (or one that isn't available), compares things,
+    contains code, refers to the chat history or asks several questions. Otherwise the classifier (if any) decides,
+    or else the question is decomposed if it follows earlier messages (the decomposition resolves it against them)
+    or is longer than `max_words`.
+    """
+    def __init__(self, classifier: Optional[Callable[[dict], float]] = None, max_words: int = 16, threshold: float = 0.5):
+        self.classifier = classifier
+        self.max_words = max_words
+        self.threshold = threshold
+        self.bypassed = 0
+        self.decomposed = 0
+        self.reasons = Counter()
+
+        self._lock = threading.Lock()
+
+
+    @classmethod
+    def from_env(cls):
+        """
+        Returns:
+            QueryRouter | None: None if the router is disabled (QUERY_ROUTER=false).
+        """
+        if os.getenv("QUERY_ROUTER", "true").lower() != "true":
+            return None
+
+        return cls(
+            classifier=load_classifier(os.getenv("QUERY_ROUTER_CLASSIFIER")),
+            max_words=int(os.getenv("QUERY_ROUTER_MAX_WORDS", "16"))
+        )
+
+
+    def features(self, query: str, versions: List[str], chat_history: list) -> dict:
+        available, unknown = mentioned_versions(query, versions)
+
+        return {
+            "words": len(query.split()),
+            "questions": query.count("?"),
+            "versions": available,
+            "unknown_versions": unknown,
+            "comparison": comparison_pattern.search(query) is not None,
+            "code": code_pattern.search(query) is not None,
+            "history": len(chat_history) > 0,
+            "history_reference": len(chat_history) > 0 and reference_pattern.search(query) is not None,
+        }
+
+
+    def route(self, query: str, versions: List[str], chat_history: list) -> Optional[list]:
+        """
+        Returns:
+            list | None: The sub-queries (`[{query, version}]`, like `decompose`) if the decomposition can be
+                skipped, None if the question needs it.
+        """
+        features = self.features(query, versions, chat_history)
+        reason = self._decomposition_reason(features)
+
+        with self._lock:
+            self.reasons[reason or "simple"] += 1
+            if reason is not None:
+                self.decomposed += 1
+                return None
+            self.bypassed += 1
+
+        version = features["versions"][0] if features["versions"] else versions[0]
+        return [{"query": query, "version": version}]
+
+
+    def _decomposition_reason(self, features: dict) -> Optional[str]:
+        if len(features["versions"]) > 1 or features["unknown_versions"]:
+            return "versions"
+        for feature in ["comparison", "code", "history_reference"]:
+            if features[feature]:
+                return feature
+        if features["questions"] > 1:
+            return "questions"
+
+        if self.classifier is not None:
+            return "classifier" if self.classifier(features) >= self.threshold else None
+
+        if features["history"]:
+            return "history"
+        return "length" if features["words"] > self.max_words else None
+
+
+    def stats(self) -> dict:
+        total = self.bypassed + self.decomposed
+        return {
+            "bypassed": self.bypassed,
+            "decomposed": self.decomposed,
+            "bypass_ratio": self.bypassed / total if total else 0.0,
+            "reasons": dict(self.reasons),
+        }
@@ -1,45 +1,138 @@
 import os
+import re
 import json
+import time
+import threading
+import contextvars
 import numpy as np
 import streamlit as st
 from json_repair import repair_json
-from .config import get_doc_versions
+from .config import get_doc_versions, is_dedup_storage
 from llama_index.core import Settings
+from llama_index.core.llms import CompletionResponse
 from trulens.core import Select, Feedback
 from trulens.apps.custom import instrument
 from trulens.providers.cortex.provider import Cortex
 from trulens.providers.openai.provider import OpenAI
-from snowflake.snowpark.context import get_active_session
+from src.ServiceRegistry import registry
 from src.CortexSearchRetriever import CortexSearchRetriever
+from src.LocalVectorRetriever import LocalVectorRetriever
+from src.LexicalIndex import LexicalIndex, reciprocal_rank_fusion
+from src.ResultCache import normalize_query, make_key, get_decomposition_cache, get_retrieval_cache
+from src.decomposition import iter_json_objects, is_sub_query, parse_sub_queries, sub_query_key
+from src.QueryRouter import QueryRouter
+from src.SemanticCache import get_semantic_cache
 from src.prompts import query_prompt_v2, decomposition_prompt
 from trulens.core.guardrails.base import context_filter, block_output
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+_provider = None
+
+
+def get_provider():
+    """
+    Cortex feedback provider on the current session of the registry (re-created along with the session).
+    """
+    global _provider
+    session = registry.get_session()
+    if _provider is None or _provider[0] is not session:
+        # provider = OpenAI()
+        _provider = (session, Cortex(session, model_engine=os.getenv("SNOWFLAKE_EVAL_LLM")))
+
+    return _provider[1]
+
+
+# The filter outlives the session, so the provider is looked up on every call.
+def context_relevance(question: str, context: str) -> float:
+    return get_provider().context_relevance(question, context)
 
-# provider = OpenAI()
-provider = Cortex(
-    get_active_session(),
-    model_engine=os.getenv("SNOWFLAKE_EVAL_LLM")
-)
 
 context_filter_feedback = (
-    Feedback(provider.context_relevance, name="Context Relevance Filter")
+    Feedback(context_relevance, name="Context Relevance Filter")
     .on_input()
     .on(Select.RecordCalls.filter_context.rets)
 )
 
+# Shared pool for the leaf Cortex Search calls. Every doc & post search of a question
+# goes through it, so the total fan-out stays bounded no matter how many sessions are active.
+search_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("RETRIEVAL_MAX_WORKERS", "6")),
+    thread_name_prefix="cortex-search"
+)
+
+
+def gather(futures):
+    """
+    Future of the results of all the futures (in the same order), without a thread waiting on them.
+    """
+    combined = Future()
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def done(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0] > 0:
+                return
+        try:
+            combined.set_result([future.result() for future in futures])
+        except Exception as e:
+            combined.set_exception(e)
+
+    if not futures:
+        combined.set_result([])
+    for future in futures:
+        future.add_done_callback(done)
+
+    return combined
+
+
+def submit(pool, fn, *args):
+    """
+    Submit a call to the pool while carrying over the current context (needed by trulens instrumentation).
+    """
+    ctx = contextvars.copy_context()
+    return pool.submit(ctx.run, fn, *args)
+
 
 class RAGQueryEngine():
     def __init__(self):
-        session = get_active_session()
         NUM_CHUNKS = int(os.getenv("NUM_CHUNKS"))
         POSTS_COLUMNS = ["title", "url", "type"]
-        DOCS_COLUMNS = ["title", "relative_path", "version", "file_content"]
+        self.dedup_storage = is_dedup_storage()
+        DOCS_COLUMNS = ["title", "relative_path", "versions" if self.dedup_storage else "version", "file_content"]
 
         self.llm = Settings.llm
+        self.search_timeout = float(os.getenv("RETRIEVAL_TIMEOUT", "10"))
         self.doc_retriever = CortexSearchRetriever(
-            session, os.getenv("CORTEX_DOC_SEARCH_SERVICE"), DOCS_COLUMNS, NUM_CHUNKS
+            os.getenv("CORTEX_DOC_SEARCH_SERVICE"), DOCS_COLUMNS, NUM_CHUNKS
         )
+        # Local embedding index (if built), used instead of Cortex Search for the docs (RETRIEVAL_BACKEND=local)
+        # or when the Cortex Search of the docs fails or times out.
+        self.local_doc_retriever = LocalVectorRetriever.load(DOCS_COLUMNS, NUM_CHUNKS)
+        if os.getenv("RETRIEVAL_BACKEND", "cortex") == "local":
+            if self.local_doc_retriever is None:
+                raise ValueError("RETRIEVAL_BACKEND is local but there is no local index, build it with scripts/buildLocalIndex.py")
+            self.doc_retriever, self.local_doc_retriever = self.local_doc_retriever, None
+        # BM25 index of the docs (built by processAndChunk), its results are fused with the docs search results.
+        self.lexical_doc_retriever = None
+        if os.getenv("HYBRID_RETRIEVAL", "true").lower() == "true":
+            self.lexical_doc_retriever = LexicalIndex.load(DOCS_COLUMNS, NUM_CHUNKS)
+        self.rrf_k = int(os.getenv("RRF_K", "60"))
+        self.num_chunks = NUM_CHUNKS
+        # Answers of earlier questions that mean the same (SEMANTIC_CACHE=false disables it), dropped when the searches are rebuilt.
+        self.embed_model = Settings.embed_model
+        self.semantic_cache = get_semantic_cache([
+            f"retrieval:{os.getenv('CORTEX_DOC_SEARCH_SERVICE')}", f"retrieval:{os.getenv('CORTEX_POSTS_SEARCH_SERVICE')}"
+        ])
+        # Skips the decomposition of the simple questions (QUERY_ROUTER=false decomposes everything).
+        self.query_router = QueryRouter.from_env()
+        # Decompositions of the same prompt (question, chat history & versions) are shared by all the sessions.
+        self.decomposition_cache = get_decomposition_cache()
+        # Start the retrieval while the query is being decomposed (see decompose_and_search).
+        self.pipelined_decomposition = os.getenv("PIPELINED_DECOMPOSITION", "true").lower() == "true"
         self.post_retriever = CortexSearchRetriever(
-            session, os.getenv("CORTEX_POSTS_SEARCH_SERVICE"), POSTS_COLUMNS, NUM_CHUNKS
+            os.getenv("CORTEX_POSTS_SEARCH_SERVICE"), POSTS_COLUMNS, NUM_CHUNKS
         )
 
 
@@ -61,18 +154,107 @@ class RAGQueryEngine():
         return results
 
 
+    def search_result(self, future, name: str, query: str, deadline: float, fallback = None):
+        """
+        Wait for a submitted search, until the deadline (time.monotonic). A search that fails or runs over the
+        timeout only drops its own results (or is answered by the fallback if there is one).
+        """
+        try:
+            return future.result(timeout=max(deadline - time.monotonic(), 0))
+        except FutureTimeoutError:
+            future.cancel()
+            print(f"{name} search timed out after {self.search_timeout}s for query: {query}")
+        except Exception as e:
+            print(f"{name} search failed for query: {query}. Error: {e}")
+
+        if fallback is not None:
+            try:
+                return fallback()
+            except Exception as e:
+                print(f"{name} fallback search failed for query: {query}. Error: {e}")
+
+        return []
+
+
+    def local_fallback(self, query: str, version_filter, deadline: float):
+        """
+        Search the local index instead of Cortex Search. The query embedding is reused if it is cached,
+        otherwise it is only computed (a Cortex call with the default embed model) in the time left before the deadline.
+        """
+        embedding = getattr(self.embed_model, "cached_embedding", lambda text: None)(query)
+        if embedding is None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise FutureTimeoutError("no time left to embed the query")
+            embedding = submit(search_pool, self.embed_model.get_query_embedding, query).result(timeout=remaining)
+
+        return self.local_doc_retriever.retrieve(query, version_filter, embedding)
+
+
     @instrument
-    def retrieve_context(self, query: str, version: str):
+    def retrieve_context(self, query: str, version: str, docs = None):
         """
         Retrieve relevant text from vector store.
+
+        Args:
+            docs: Optional, the results of a `search` started earlier (the speculative search), only filtered here.
         """
-        docs = self.doc_retriever.retrieve(query, {"@eq": {"version": version}})
-        posts = self.post_retriever.retrieve(query)
-        docs.extend(posts)
+        if docs is None:
+            docs = self.search(query, version)
 
         return self.filter_context(query, docs)
 
 
+    def search(self, query: str, version: str):
+        """
+        The docs & posts searches of `retrieve_context`, without the instrumentation & the context filter
+        (so a search whose results may be dropped costs neither feedback calls nor eval records).
+        """
+        # Chunks shared by many versions carry all of them.
+        version_filter = {"@contains": {"versions": version}} if self.dedup_storage else {"@eq": {"version": version}}
+
+        # Both searches are in flight at the same time, the fallback of the docs search included they share one timeout.
+        deadline = time.monotonic() + self.search_timeout
+        docs = submit(search_pool, self.doc_retriever.retrieve, query, version_filter)
+        posts = submit(search_pool, self.post_retriever.retrieve, query)
+
+        # The BM25 search is local, it runs while the searches above are in flight.
+        lexical_docs = None
+        if self.lexical_doc_retriever is not None:
+            try:
+                lexical_docs = self.lexical_doc_retriever.retrieve(query, version_filter)
+            except Exception as e:
+                print(f"Lexical search failed for query: {query}. Error: {e}")
+
+        fallback = None
+        if self.local_doc_retriever is not None:
+            fallback = lambda: self.local_fallback(query, version_filter, deadline)
+        docs = self.search_result(docs, "Docs", query, deadline, fallback)
+        if lexical_docs is not None:
+            docs = reciprocal_rank_fusion([docs, lexical_docs], self.num_chunks, self.rrf_k)
+        if self.dedup_storage:
+            for doc in docs:
+                doc["version"] = version
+        docs.extend(self.search_result(posts, "Posts", query, deadline))
+
+        return docs
+
+
+    def search_all(self, queries):
+        """
+        Start the retrieval of the context of every sub-query, concurrently. The sub-query threads only wait on the
+        shared search pool, so they never compete with it for workers.
+
+        Returns:
+            Future: Context for each sub-query, in the same order as the sub-queries.
+        """
+        pool = ThreadPoolExecutor(max_workers=max(len(queries), 1), thread_name_prefix="sub-query")
+        try:
+            return gather([submit(pool, self.retrieve_context, q["query"], q["version"]) for q in queries])
+        finally:
+            pool.shutdown(wait=False)
+
+
     def get_chat_history(self):
         SLIDE_WINDOW = 7
         chat_history = []
@@ -96,53 +278,241 @@ class RAGQueryEngine():
 
 
     @instrument
-    def generate_completion(self, query: str, context: list) -> str:
+    def generate_completion(self, query: str, context: list, cancel_event = None) -> str:
         prompt = self.get_completion_prompt(query, context)
-        response = self.llm.stream_complete(prompt)
+        response = self.llm.stream_complete(prompt, cancel_event=cancel_event)
         return response
 
 
-    @instrument
-    def decompose(self, query: str):
-        prompt = decomposition_prompt.format(
+    def get_decomposition_prompt(self, query: str):
+        return decomposition_prompt.format(
             versions = get_doc_versions(),
             latest_version = get_doc_versions()[0],
             query = query,
             chat_history = self.get_chat_history()
         )
 
-        queries = json.loads(repair_json(self.llm.complete(prompt).text))
+
+    @instrument
+    def route(self, query: str):
+        """
+        Returns:
+            list | None: The sub-queries if the question doesn't need the decomposition (see QueryRouter).
+        """
+        if self.query_router is None:
+            return None
+
+        return self.query_router.route(query, get_doc_versions(), self.get_chat_history())
+
+
+    @instrument
+    def decompose(self, query: str):
+        prompt = self.get_decomposition_prompt(query)
+        queries = self.cached_decomposition(prompt)
+        if queries is None:
+            queries = json.loads(repair_json(self.llm.complete(prompt).text))
+            self.cache_decomposition(prompt, queries)
 
         return queries
 
 
+    def cached_decomposition(self, prompt: str):
+        if self.decomposition_cache is None:
+            return None
+
+        return self.decomposition_cache.get(make_key(self.llm.metadata.model_name, prompt))
+
+
+    def cache_decomposition(self, prompt: str, queries):
+        if self.decomposition_cache is not None:
+            self.decomposition_cache.set(make_key(self.llm.metadata.model_name, prompt), queries)
+
+
+    def decompose_and_search(self, query: str):
+        """
+        Pipelined `decompose` + `search_all`: the raw query is searched in the latest version while the
+        decomposition is generated, and every sub-query is searched as soon as its object is complete in the stream.
+        The speculative search is used if the raw query at the latest version is one of the sub-queries
+        (the decomposition prompt asks for it), otherwise it is dropped. Once the stream ends, the whole output
+        is parsed and the sub-queries the streaming parser missed are searched too.
+
+        Returns:
+            Tuple[list, Future]: The sub-queries (once the decomposition is complete) & the future of the context
+                of each of them (in the same order).
+        """
+        # The speculative search & the sub-queries (max 3, more are queued).
+        pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="sub-query")
+        try:
+            prompt = self.get_decomposition_prompt(query)
+            queries = self.cached_decomposition(prompt)
+            if queries is not None:
+                return queries, self.search_all(queries)
+
+            latest_version = get_doc_versions()[0]
+            speculative = submit(pool, self.search, query, latest_version)
+            speculative_key = sub_query_key({"query": query, "version": latest_version})
+            # Search of every distinct sub-query (by normalized query & version) dispatched so far.
+            searches = {}
+
+            def keep_speculative():
+                # Only the kept results go through the (instrumented) context filter.
+                return self.retrieve_context(query, latest_version, speculative.result())
+
+            def dispatch(sub_query):
+                key = sub_query_key(sub_query)
+                if key not in searches:
+                    if key == speculative_key:
+                        searches[key] = submit(pool, keep_speculative)
+                    else:
+                        searches[key] = submit(pool, self.retrieve_context, sub_query["query"], sub_query["version"])
+
+            text = []
+            def stream():
+                for chunk in self.llm.stream_complete(prompt):
+                    text.append(chunk.delta)
+                    yield chunk.delta
+
+            streamed = []
+            for sub_query in iter_json_objects(stream()):
+                if is_sub_query(sub_query):
+                    streamed.append(sub_query)
+                    dispatch(sub_query)
+
+            # The whole output is the reference (the streamed objects are only used to start the searches early).
+            queries = parse_sub_queries("".join(text))
+            if queries:
+                self.cache_decomposition(prompt, queries)
+            else:
+                queries = streamed or [{"query": query, "version": latest_version}]
+
+            for sub_query in queries:
+                dispatch(sub_query)
+
+            return queries, gather([searches[sub_query_key(sub_query)] for sub_query in queries])
+        finally:
+            # An unused speculative search finishes in the background.
+            pool.shutdown(wait=False)
+
+
+    def replay(self, answer: str):
+        """
+        Stream a cached answer like `generate_completion` does.
+        """
+        for token in re.findall(r"\s*\S+", answer):
+            yield CompletionResponse(text=token, delta=token)
+
+
+    def remember(self, response, embedding, scope, references, cancel_event = None):
+        """
+        Pass the streamed answer through and add it to the semantic cache once it is complete.
+        """
+        tokens = []
+        try:
+            for chunk in response:
+                tokens.append(chunk.delta)
+                yield chunk
+        finally:
+            response.close()
+
+        # Not reached if the consumer stopped early.
+        if tokens and (cancel_event is None or not cancel_event.is_set()):
+            self.semantic_cache.set(embedding, scope, {"answer": "".join(tokens), "references": references})
+
+
+    def semantic_lookup(self, queries):
+        """
+        Look up the answer of the resolved question (the sub-queries, so a follow-up is looked up with the context
+        the decomposition took from the chat history).
+
+        Returns:
+            Tuple[dict | None, List[float] | None, tuple]: The cached answer, the embedding & the scope (the versions)
+                of the resolved question.
+        """
+        text = "\n".join(sorted(normalize_query(sub_query["query"]) for sub_query in queries))
+        scope = tuple(sorted(set(sub_query["version"] for sub_query in queries)))
+        try:
+            embedding = self.embed_model.get_query_embedding(text)
+        except Exception as e:
+            print(f"Embedding for the semantic cache failed for query: {text}. Error: {e}")
+            return None, None, scope
+
+        return self.semantic_cache.get(embedding, scope), embedding, scope
+
+
     @instrument
-    def query(self, query: str) -> str:
-        queries = self.decompose(query)
+    def query(self, query: str, cancel_event = None) -> str:
+        queries = self.route(query)
+        if queries is not None:
+            retrieval = self.search_all(queries)
+        elif self.pipelined_decomposition:
+            queries, retrieval = self.decompose_and_search(query)
+        else:
+            queries = self.decompose(query)
+            retrieval = self.search_all(queries)
+
+        # The resolved question is embedded while its context is retrieved.
+        embedding = None
+        if self.semantic_cache is not None and queries:
+            cached, embedding, scope = self.semantic_lookup(queries)
+            if cached is not None:
+                # The retrieval isn't needed anymore, it finishes in the background.
+                return {
+                    "result": self.replay(cached["answer"]),
+                    "references": cached["references"]
+                }
+
+        query_contexts = retrieval.result()
 
         contexts = []
         relative_paths = {}
-        # Maybe we can make these calls async.
-        for q in queries:
-            context = self.retrieve_context(q["query"], q["version"])
-
+        for context in query_contexts:
             contexts.extend(context)
             for item in context:
                 if "version" in item.keys():
                     relative_paths[item['title']] = f"https://github.com/{os.getenv('REPO_NAME')}/blob/{item['version']}/docs/" + item["relative_path"].replace("\\", "/")
 
+        response = self.generate_completion(query, contexts, cancel_event)
+        if embedding is not None:
+            response = self.remember(response, embedding, scope, relative_paths, cancel_event)
+
         return {
-            "result": self.generate_completion(query, contexts),
+            "result": response,
             "references": relative_paths
         }
 
 
+    def stats(self) -> dict:
+        """
+        Counters of the caches & the router of this process (the disabled ones are left out).
+        """
+        stats = {}
+        for name, component in [
+            ("query_router", self.query_router), ("decomposition_cache", self.decomposition_cache),
+            ("semantic_cache", self.semantic_cache)
+        ]:
+            if component is not None:
+                stats[name] = component.stats()
+
+        for name, service in [("docs", os.getenv("CORTEX_DOC_SEARCH_SERVICE")), ("posts", os.getenv("CORTEX_POSTS_SEARCH_SERVICE"))]:
+            cache = get_retrieval_cache(service)
+            if cache is not None:
+                stats[f"retrieval_cache:{name}"] = cache.stats()
+
+        embedding_cache = getattr(self.embed_model, "cache_stats", lambda: None)()
+        if embedding_cache is not None:
+            stats["embedding_cache"] = embedding_cache
+
+        return stats
+
+
     @property
     def version(self):
-        return "v3"
+        # Evaluations with & without the router are recorded as different app versions.
+        return "v3" if self.query_router is None else "v3-routed"
 
 
     def eval_metrics(self):
+        provider = get_provider()
         f_groundedness = (
             Feedback(provider.groundedness_measure_with_cot_reasons, name="Groundedness")
             .on(Select.RecordCalls.retrieve_context[:].rets[:].collect())
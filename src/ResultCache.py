@@ -0,0 +1,238 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from functools import lru_cache
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+def make_key(*parts) -> str:
+    """
+    Build a stable cache key from json serializable parts (dict keys are sorted so filter objects hash the same).
+    """
+    return hashlib.sha256(
+        json.dumps(parts, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+def shared_cache_path() -> Optional[str]:
+    """
+    SQLite file of the shared tier (RESULT_CACHE_PATH), None if it is disabled (empty RESULT_CACHE_PATH).
+    """
+    return os.getenv("RESULT_CACHE_PATH", "resultCache.db") or None
+
+
+def _connect(path: str):
+    conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS entries (namespace TEXT, key TEXT, value TEXT, expires_at REAL, generation INTEGER, PRIMARY KEY (namespace, key))"
+    )
+    conn.execute("CREATE TABLE IF NOT EXISTS generations (namespace TEXT PRIMARY KEY, generation INTEGER, settles_at REAL)")
+    # Files created before the invalidations had a settling time.
+    if "settles_at" not in [column[1] for column in conn.execute("PRAGMA table_info(generations)")]:
+        conn.execute("ALTER TABLE generations ADD COLUMN settles_at REAL")
+    conn.commit()
+    return conn
+
+
+def invalidate_shared(namespace: str, path: Optional[str] = None, settle: float = 0):
+    """
+    Invalidate every entry of the namespace in the shared (on disk) tier.
+    This is what the indexing scripts use, they run in a different process than the app.
+
+    Args:
+        settle (float): Seconds the source takes to reflect the change (e.g. the TARGET_LAG of a search service).
+            Entries cached in that window can still be stale, they expire when it ends.
+    """
+    path = path or shared_cache_path()
+    if not path:
+        return
+
+    conn = _connect(path)
+    try:
+        _bump_generation(conn, namespace, time.time() + settle if settle > 0 else None)
+    finally:
+        conn.close()
+
+
+def read_generation(conn, namespace: str) -> int:
+    row = conn.execute("SELECT generation FROM generations WHERE namespace = ?", (namespace,)).fetchone()
+    return row[0] if row else 0
+
+
+def read_settles_at(conn, namespace: str) -> Optional[float]:
+    """
+    Returns:
+        float | None: When the last invalidation of the namespace settles, None if it has no settling time.
+    """
+    row = conn.execute("SELECT settles_at FROM generations WHERE namespace = ?", (namespace,)).fetchone()
+    return row[0] if row else None
+
+
+def _bump_generation(conn, namespace: str, settles_at: Optional[float] = None):
+    conn.execute(
+        "INSERT INTO generations (namespace, generation, settles_at) VALUES (?, 1, ?) "
+        "ON CONFLICT(namespace) DO UPDATE SET generation = generation + 1, settles_at = excluded.settles_at",
+        (namespace, settles_at)
+    )
+    conn.execute("DELETE FROM entries WHERE namespace = ?", (namespace,))
+    conn.commit()
+
+
+class ResultCache:
+    """
+    Two tier cache for json serializable results.
+
+    The first tier is an in-process LRU with TTL. The second (optional) tier is a SQLite file which
+    can be shared by multiple app workers. Each namespace has a generation number, bumping it (see `invalidate_shared`)
+    makes all the entries created before it stale in both tiers.
+    Entries created while an invalidation settles don't outlive it.
+    """
+    def __init__(self, namespace: str, max_size: int = 256, ttl: float = 3600, path: Optional[str] = None):
+        self.namespace = namespace
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._local_generation = 0
+        self._conn = _connect(path) if path else None
+
+
+    def _generation(self) -> int:
+        if self._conn is None:
+            return self._local_generation
+
+        return read_generation(self._conn, self.namespace)
+
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Returns a fresh copy of the cached value or None on a miss.
+        """
+        now = time.time()
+        with self._lock:
+            generation = self._generation()
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, entry_generation, value = entry
+                if expires_at > now and entry_generation == generation:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return json.loads(value)
+
+                del self._entries[key]
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT value, expires_at FROM entries WHERE namespace = ? AND key = ? AND generation = ? AND expires_at > ?",
+                    (self.namespace, key, generation, now)
+                ).fetchone()
+                if row is not None:
+                    self._remember(key, row[1], generation, row[0])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return json.loads(row[0])
+
+            self.misses += 1
+            return None
+
+
+    def set(self, key: str, value: Any):
+        value = json.dumps(value)
+        now = time.time()
+        expires_at = now + self.ttl
+        with self._lock:
+            generation = self._generation()
+            if self._conn is not None:
+                settles_at = read_settles_at(self._conn, self.namespace)
+                if settles_at is not None and settles_at > now:
+                    expires_at = min(expires_at, settles_at)
+            self._remember(key, expires_at, generation, value)
+
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO entries (namespace, key, value, expires_at, generation) VALUES (?, ?, ?, ?, ?)",
+                    (self.namespace, key, value, expires_at, generation)
+                )
+                self._conn.commit()
+
+
+    def _remember(self, key, expires_at, generation, value):
+        if self.max_size <= 0:
+            return
+
+        self._entries[key] = (expires_at, generation, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+    def invalidate(self):
+        """
+        Drop everything cached for this namespace (in this process and in the shared tier).
+        """
+        with self._lock:
+            self._entries.clear()
+            self._local_generation += 1
+
+            if self._conn is not None:
+                _bump_generation(self._conn, self.namespace)
+
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "namespace": self.namespace,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "size": len(self._entries),
+        }
+
+
+@lru_cache(maxsize=None)
+def get_retrieval_cache(service: str):
+    """
+    Process wide retrieval cache for a search service. Returns None if caching is disabled.
+
+    It needs the shared tier: that is how the indexing scripts (other processes) invalidate the results of a
+    reloaded index, without it cached results would outlive the reload.
+    """
+    if int(os.getenv("RESULT_CACHE_SIZE", "256")) <= 0 or shared_cache_path() is None:
+        return None
+
+    return ResultCache(
+        f"retrieval:{service}",
+        max_size=int(os.getenv("RESULT_CACHE_SIZE", "256")),
+        ttl=float(os.getenv("RESULT_CACHE_TTL", "3600")),
+        path=shared_cache_path()
+    )
+
+
+@lru_cache(maxsize=None)
+def get_decomposition_cache():
+    """
+    Process wide cache of the query decompositions. Returns None if caching is disabled.
+    """
+    if int(os.getenv("DECOMPOSITION_CACHE_SIZE", "256")) <= 0:
+        return None
+
+    return ResultCache(
+        "decomposition",
+        max_size=int(os.getenv("DECOMPOSITION_CACHE_SIZE", "256")),
+        ttl=float(os.getenv("DECOMPOSITION_CACHE_TTL", "3600")),
+        path=shared_cache_path()
+    )
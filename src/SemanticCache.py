@@ -0,0 +1,136 @@
+import os
+import time
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Any, List, Optional
+from src.ResultCache import _connect, read_generation, read_settles_at, shared_cache_path
+
+
+class SemanticCache:
+    """
+    In-process cache of answers looked up by the similarity of the question embeddings.
+
+    An answer is only returned for a question of the same scope (the doc versions it is about) with a cosine
+    similarity of at least `threshold`. The least recently used answers are evicted past `max_size` and every
+    answer expires after `ttl` seconds.
+
+    Every answer is dropped when one of `namespaces` is invalidated in the shared tier of `ResultCache`
+    (the indexing scripts do it when the search services are rebuilt, answers cached while the invalidation settles
+    expire when it ends), when one of `stamp_paths` is modified (files written by the indexing, this works without
+    the shared tier), or with `invalidate`.
+    """
+    def __init__(
+        self, max_size: int = 512, threshold: float = 0.95, ttl: float = 3600, namespaces: List[str] = [],
+        path: Optional[str] = None, stamp_paths: List[str] = []
+    ):
+        self.max_size = max_size
+        self.threshold = threshold
+        self.ttl = ttl
+        self.namespaces = namespaces
+        self.stamp_paths = stamp_paths
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._next_id = 0
+        self._generations = None
+        self._conn = _connect(path) if path else None
+
+
+    def _check_generations(self):
+        generations = [os.path.getmtime(path) if os.path.exists(path) else None for path in self.stamp_paths]
+        if self._conn is not None:
+            generations.extend(read_generation(self._conn, namespace) for namespace in self.namespaces)
+
+        if generations != self._generations:
+            self._entries.clear()
+            self._generations = generations
+
+
+    def get(self, embedding: List[float], scope) -> Optional[Any]:
+        """
+        Returns the value of the most similar question in the scope, None if there is none above the threshold.
+        """
+        vector = self._normalize(embedding)
+        with self._lock:
+            self._check_generations()
+            now = time.time()
+            for entry_id in [entry_id for entry_id, entry in self._entries.items() if entry[3] <= now]:
+                del self._entries[entry_id]
+
+            ids = [entry_id for entry_id, (entry_scope, _, _, _) in self._entries.items() if entry_scope == scope]
+            if ids:
+                scores = np.stack([self._entries[entry_id][1] for entry_id in ids]) @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self._entries.move_to_end(ids[best])
+                    self.hits += 1
+                    return self._entries[ids[best]][2]
+
+            self.misses += 1
+            return None
+
+
+    def set(self, embedding: List[float], scope, value: Any):
+        if self.max_size <= 0:
+            return
+
+        vector = self._normalize(embedding)
+        with self._lock:
+            self._check_generations()
+            now = time.time()
+            expires_at = now + self.ttl
+            if self._conn is not None:
+                settling = [read_settles_at(self._conn, namespace) for namespace in self.namespaces]
+                expires_at = min([expires_at] + [settles_at for settles_at in settling if settles_at is not None and settles_at > now])
+            self._entries[self._next_id] = (scope, vector, value, expires_at)
+            self._next_id += 1
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "size": len(self._entries),
+        }
+
+
+def get_semantic_cache(namespaces: List[str]):
+    """
+    Returns:
+        SemanticCache | None: None if the cache is disabled (SEMANTIC_CACHE=false or SEMANTIC_CACHE_SIZE=0).
+    """
+    max_size = int(os.getenv("SEMANTIC_CACHE_SIZE", "512"))
+    if os.getenv("SEMANTIC_CACHE", "true").lower() != "true" or max_size <= 0:
+        return None
+
+    return SemanticCache(
+        max_size=max_size,
+        threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95")),
+        ttl=float(os.getenv("SEMANTIC_CACHE_TTL", "3600")),
+        namespaces=namespaces,
+        path=shared_cache_path(),
+        # Rewritten by every processing of the docs & every build of the local indexes.
+        stamp_paths=[
+            os.path.join(os.getenv("CHUNK_CSV_OUTPUT", "stagingData"), "manifest.json"),
+            os.path.join(os.getenv("LEXICAL_INDEX_PATH", "lexicalIndex"), "terms.json"),
+            os.path.join(os.getenv("LOCAL_INDEX_PATH", "localIndex"), "embeddings.npy"),
+        ]
+    )
@@ -0,0 +1,98 @@
+import os
+import time
+import threading
+from snowflake.core import Root
+from snowflake.snowpark import Session
+from snowflake.snowpark.context import get_active_session
+
+
+def connection_parameters():
+    return {
+        "account": os.getenv("SNOWFLAKE_ACCOUNT"),
+        "user": os.getenv("SNOWFLAKE_USER"),
+        "password": os.getenv("SNOWFLAKE_PASSWORD"),
+        "database": os.getenv("SNOWFLAKE_DB"),
+        "schema": os.getenv("SNOWFLAKE_SCHEMA"),
+    }
+
+
+class ServiceRegistry:
+    """
+    Process wide registry of the Snowpark session and the resolved Cortex Search service handles.
+
+    Everything is resolved once and reused by all the engines (and streamlit reruns) of the process.
+    The session is health checked at most once every `health_check_interval` seconds and is re-created
+    (along with the handles built on it) when the check or a search fails.
+    The old session is closed then, so it is looked up with `get_session` on every use instead of being kept.
+    """
+    def __init__(self, health_check_interval: float = 60):
+        self.health_check_interval = health_check_interval
+        self._lock = threading.RLock()
+        self._session = None
+        self._checked_at = 0
+        self._services = {}
+
+
+    def get_session(self) -> Session:
+        with self._lock:
+            if self._session is None:
+                self._session = self._connect()
+                self._checked_at = time.time()
+            elif time.time() - self._checked_at > self.health_check_interval:
+                if not self._healthy():
+                    print("Snowflake session is not healthy. Reconnecting.")
+                    self._reconnect()
+                self._checked_at = time.time()
+
+            return self._session
+
+
+    def get_search_service(self, name: str):
+        with self._lock:
+            if name not in self._services:
+                root = Root(self.get_session())
+                self._services[name] = (
+                    root.databases[os.getenv("SNOWFLAKE_DB")]
+                    .schemas[os.getenv("SNOWFLAKE_SCHEMA")]
+                    .cortex_search_services[name]
+                )
+
+            return self._services[name]
+
+
+    def reset(self):
+        """
+        Forget the resolved handles and force a health check on next access.
+        """
+        with self._lock:
+            self._services = {}
+            self._checked_at = 0
+
+
+    def _connect(self) -> Session:
+        try:
+            return get_active_session()
+        except:
+            print("No Active Session Found. Creating Session.")
+            return Session.builder.configs(connection_parameters()).create()
+
+
+    def _healthy(self) -> bool:
+        try:
+            self._session.sql("SELECT 1").collect()
+            return True
+        except Exception:
+            return False
+
+
+    def _reconnect(self):
+        try:
+            self._session.close()
+        except Exception:
+            pass
+
+        self._services = {}
+        self._session = Session.builder.configs(connection_parameters()).create()
+
+
+registry = ServiceRegistry(int(os.getenv("SESSION_HEALTH_CHECK_INTERVAL", "60")))
@@ -6,22 +6,23 @@ from trulens.core import Select, Feedback
 from trulens.apps.custom import instrument
 from trulens.providers.openai.provider import OpenAI
 from trulens.providers.cortex.provider import Cortex
+from src.config import is_dedup_storage
 from src.prompts import query_prompt, summary_prompt
-from snowflake.snowpark.context import get_active_session
+from src.ServiceRegistry import registry
 from src.CortexSearchRetriever import CortexSearchRetriever
 
 
 class SimpleRAG:
     def __init__(self):
-        session = get_active_session()
         NUM_CHUNKS = int(os.getenv("NUM_CHUNKS"))
         POSTS_COLUMNS = ["title", "url", "type"]
-        DOCS_COLUMNS = ["title", "relative_path", "version", "file_content"]
+        self.dedup_storage = is_dedup_storage()
+        DOCS_COLUMNS = ["title", "relative_path", "versions" if self.dedup_storage else "version", "file_content"]
 
         self.llm = Settings.llm
         self.retriever = [
-            CortexSearchRetriever(session, os.getenv("CORTEX_DOC_SEARCH_SERVICE"), DOCS_COLUMNS, NUM_CHUNKS),
-            CortexSearchRetriever(session, os.getenv("CORTEX_POSTS_SEARCH_SERVICE"), POSTS_COLUMNS, NUM_CHUNKS)
+            CortexSearchRetriever(os.getenv("CORTEX_DOC_SEARCH_SERVICE"), DOCS_COLUMNS, NUM_CHUNKS),
+            CortexSearchRetriever(os.getenv("CORTEX_POSTS_SEARCH_SERVICE"), POSTS_COLUMNS, NUM_CHUNKS)
         ]
 
 
@@ -31,6 +32,10 @@ class SimpleRAG:
         Retrieve relevant text from vector store.
         """
         docs, posts = self.retriever[0].retrieve(query), self.retriever[1].retrieve(query)
+        if self.dedup_storage:
+            # Latest version the chunk belongs to.
+            for doc in docs:
+                doc["version"] = doc.pop("versions")[0]
         docs.extend(posts)
 
         return docs
@@ -67,14 +72,14 @@ class SimpleRAG:
 
 
     @instrument
-    def generate_completion(self, query: str, context: list) -> str:
+    def generate_completion(self, query: str, context: list, cancel_event = None) -> str:
         prompt = self.create_prompt(query, context)
-        response = self.llm.stream_complete(prompt)
+        response = self.llm.stream_complete(prompt, cancel_event=cancel_event)
         return response
 
 
     @instrument
-    def query(self, query: str) -> str:
+    def query(self, query: str, cancel_event = None) -> str:
         context = self.retrieve_context(query)
         
         relative_paths = {
@@ -82,7 +87,7 @@ class SimpleRAG:
         }
 
         return {
-            "result": self.generate_completion(query, context),
+            "result": self.generate_completion(query, context, cancel_event),
             "references": relative_paths
         }
     
@@ -95,7 +100,7 @@ class SimpleRAG:
     def eval_metrics(self):
         # provider = OpenAI()
         provider = Cortex(
-            get_active_session(), 
+            registry.get_session(),
             model_engine=os.getenv("SNOWFLAKE_EVAL_LLM")
         )
 
@@ -1,45 +1,153 @@
 import os
+import asyncio
+import threading
 from snowflake.snowpark import Session
-from typing import Any, List, Callable
+from typing import Any, List, Callable, Optional
 from llama_index.core.embeddings import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+from src.ServiceRegistry import registry
+from src.EmbeddingCache import get_embedding_cache
 from snowflake.cortex import EmbedText768, EmbedText1024
-from snowflake.snowpark.context import get_active_session
 
 
 class SnowflakeEmbedding(BaseEmbedding):
-    session: Session
+    """
+    Cortex embeddings. A batch of texts is embedded with a single query (`EMBED_TEXT_*` over a VALUES list of
+    `EMBEDDING_BATCH_SIZE` texts) and the async methods run the queries in threads, at most
+    `EMBEDDING_MAX_CONCURRENCY` at a time.
+
+    Every embedding goes through the disk cache (see `EmbeddingCache`), the misses of a batch are embedded together.
+    """
     embed: Callable[[str], List[float]]
+    dims: int
+    max_concurrency: int
+    _semaphore: threading.BoundedSemaphore = PrivateAttr()
+    _cache: Any = PrivateAttr()
 
     def __init__(
         self,
         **kwargs: Any,
     ):
+        dims = os.getenv('CORTEX_EMBEDDING_DIMS')
+        if dims not in ['768', '1024']:
+            raise ValueError("Invalid Embedding Dims for Snowflake")
+
         super().__init__(
             model_name = os.getenv('CORTEX_EMBEDDING_MODEL'),
-            session=get_active_session(),
-            embed = EmbedText768 if os.getenv('CORTEX_EMBEDDING_DIMS') == '768' else EmbedText1024,
+            embed = EmbedText768 if dims == '768' else EmbedText1024,
+            dims = int(dims),
+            embed_batch_size = int(os.getenv('EMBEDDING_BATCH_SIZE', '100')),
+            max_concurrency = int(os.getenv('EMBEDDING_MAX_CONCURRENCY', '4')),
             **kwargs
         )
-        
-        if os.getenv('CORTEX_EMBEDDING_DIMS') not in ['768', '1024']:
-            raise "Invalid Embedding Dims for Snowflake"
+        # Shared by every thread & event loop using this model.
+        self._semaphore = threading.BoundedSemaphore(self.max_concurrency)
+        self._cache = get_embedding_cache(self.model_name, self.dims)
+
+
+    @property
+    def session(self) -> Session:
+        # Not kept, the registry re-creates the session when it fails.
+        return registry.get_session()
 
 
     def _get_query_embedding(self, query: str) -> List[float]:
-        return self.embed(self.model_name, query, self.session)
+        return self._get_text_embedding(query)
 
 
     def _get_text_embedding(self, text: str) -> List[float]:
-        return self.embed(self.model_name, text, self.session)
+        embeddings, missing = self._lookup([text])
+        if missing:
+            self._store(embeddings, missing, [self.embed(self.model_name, text, self.session)])
+
+        return embeddings[0]
 
 
     def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
-        return [self.embed(self.model_name, text, self.session) for text in texts]
+        embeddings, missing = self._lookup(texts)
+        texts = list(missing.keys())
+        vectors = []
+        for start in range(0, len(texts), self.embed_batch_size):
+            vectors.extend(self._embed_batch(texts[start:start + self.embed_batch_size]))
+        self._store(embeddings, missing, vectors)
+
+        return embeddings
+
+
+    def _lookup(self, texts: List[str]):
+        """
+        Returns:
+            Tuple[List[List[float] | None], Dict[str, List[int]]]: The cached embeddings (None for the misses)
+                & the positions of every distinct text that missed.
+        """
+        embeddings = self._cache.get_many(texts) if self._cache is not None else [None] * len(texts)
+        missing = {}
+        for idx, (text, embedding) in enumerate(zip(texts, embeddings)):
+            if embedding is None:
+                missing.setdefault(text, []).append(idx)
+
+        return embeddings, missing
+
+
+    def _store(self, embeddings, missing, vectors):
+        for positions, vector in zip(missing.values(), vectors):
+            for idx in positions:
+                embeddings[idx] = vector
+
+        if self._cache is not None and missing:
+            self._cache.add_many(list(missing.keys()), vectors)
+
+
+    def cached_embedding(self, text: str) -> Optional[List[float]]:
+        """
+        The embedding of the text if it is in the cache (never calls Cortex).
+        """
+        return self._cache.get_many([text])[0] if self._cache is not None else None
+
+
+    def cache_stats(self) -> Optional[dict]:
+        return self._cache.stats() if self._cache is not None else None
+
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed the texts with one round trip.
+        """
+        if not texts:
+            return []
+
+        model = self.model_name.replace("'", "''")
+        values = ", ".join(["(?, ?)"] * len(texts))
+        params = [value for idx, text in enumerate(texts) for value in (idx, text)]
+        rows = self.session.sql(
+            f"SELECT COLUMN1 AS IDX, SNOWFLAKE.CORTEX.EMBED_TEXT_{self.dims}('{model}', COLUMN2) AS EMBEDDING "
+            f"FROM VALUES {values} ORDER BY IDX",
+            params=params
+        ).collect()
+
+        return [list(row['EMBEDDING']) for row in rows]
+
+
+    def _bounded(self, fn: Callable, *args):
+        with self._semaphore:
+            return fn(*args)
 
 
     async def _aget_query_embedding(self, query: str) -> List[float]:
-        return self._get_query_embedding(query)
+        return await asyncio.to_thread(self._bounded, self._get_query_embedding, query)
 
 
     async def _aget_text_embedding(self, text: str) -> List[float]:
-        return self._get_text_embedding(text)
\ No newline at end of file
+        return await asyncio.to_thread(self._bounded, self._get_text_embedding, text)
+
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        embeddings, missing = self._lookup(texts)
+        texts = list(missing.keys())
+        batches = await asyncio.gather(*[
+            asyncio.to_thread(self._bounded, self._embed_batch, texts[start:start + self.embed_batch_size])
+            for start in range(0, len(texts), self.embed_batch_size)
+        ])
+        self._store(embeddings, missing, [embedding for batch in batches for embedding in batch])
+
+        return embeddings
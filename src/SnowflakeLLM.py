@@ -1,5 +1,6 @@
 import os
-from typing import Any, Dict
+import threading
+from typing import Any, Dict, Optional
 from snowflake.cortex import Complete
 from llama_index.core.llms.callbacks import llm_completion_callback
 from llama_index.core.llms import CustomLLM, CompletionResponse, CompletionResponseGen, LLMMetadata
@@ -35,10 +36,23 @@ class SnowflakeLLM(CustomLLM):
 
     @llm_completion_callback()
     def stream_complete(
-        self, prompt: str, **kwargs: Any
+        self, prompt: str, cancel_event: Optional[threading.Event] = None, **kwargs: Any
     ) -> CompletionResponseGen:
-        response = ""
+        """
+        Stream the completion. Every response only carries the new text (`text` & `delta` are the same token),
+        the consumer accumulates it.
+
+        Args:
+            cancel_event: Optional, the stream stops (and the Cortex request is closed) once it is set.
+        """
         response_stream = Complete(os.getenv('CORTEX_LLM_MODEL'), prompt, stream = True, options=self.config)
-        for token in response_stream:
-            response += token
-            yield CompletionResponse(text=response, delta=token)
+        try:
+            for token in response_stream:
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+
+                yield CompletionResponse(text=token, delta=token)
+        finally:
+            # Also runs when the consumer closes this generator (or drops it).
+            if hasattr(response_stream, "close"):
+                response_stream.close()
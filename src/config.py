@@ -2,9 +2,8 @@ import os
 import streamlit as st
 from functools import lru_cache
 from trulens.core import TruSession
-from snowflake.snowpark import Session
+from src.ServiceRegistry import registry
 from trulens.dashboard import run_dashboard
-from snowflake.snowpark.context import get_active_session
 from trulens.connectors.snowflake import SnowflakeConnector
 
 def sessionSetup():
@@ -16,28 +15,17 @@ def sessionSetup():
     st.title(f":speech_balloon: {os.getenv('APP_NAME')}")
     st.session_state.debug = os.getenv("APP_ENV") != 'production'
 
-    connection_parameters = {
-        "account": os.getenv("SNOWFLAKE_ACCOUNT"),
-        "user": os.getenv("SNOWFLAKE_USER"),
-        "password": os.getenv("SNOWFLAKE_PASSWORD"),
-        "database": os.getenv("SNOWFLAKE_DB"),
-        "schema": os.getenv("SNOWFLAKE_SCHEMA"),
-    }
-
     # tru_snowflake_connector = SnowflakeConnector(
     #     warehouse = os.getenv("SNOWFLAKE_WAREHOUSE"),
     #     role = os.getenv("SNOWFLAKE_ROLE"),
-    #     **connection_parameters
+    #     **connection_parameters()
     # )
     # lens_session = TruSession(connector=tru_snowflake_connector)
 
     # run_dashboard(session, port=os.getenv("TRULENS_PORT"))
 
-    try:
-        session = get_active_session()
-    except:
-        print("No Active Session Found. Creating Session.")
-        session = Session.builder.configs(connection_parameters).create()
+    # Created once per process and reused by every rerun.
+    session = registry.get_session()
 
     categories = get_doc_versions()
     print(categories)
@@ -53,12 +41,23 @@ def sessionSetup():
     # return lens_session
 
 
+def is_dedup_storage():
+    """
+    Docs are stored once per distinct chunk with the list of versions they belong to (DOC_STORAGE_MODE=dedup).
+    """
+    return os.getenv("DOC_STORAGE_MODE", "versioned") == "dedup"
+
+
 @lru_cache(maxsize=1)
 def get_doc_versions():
-    session = get_active_session()
+    session = registry.get_session()
+    table = os.getenv("SNOWFLAKE_DOC_TABLE_NAME")
+    if is_dedup_storage():
+        table = f"{table}_VERSIONS"
+
     return [
         row['VERSION'] for row in (
-            session.table(os.getenv("SNOWFLAKE_DOC_TABLE_NAME"))
+            session.table(table)
             .select('version')
             .distinct()
             .sort('version', ascending=False)
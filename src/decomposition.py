@@ -0,0 +1,61 @@
+"""
+Parsing of the decomposition output (see `decomposition_prompt`): a JSON array of `{query, version}` objects,
+usually with single quoted strings.
+"""
+import json
+from json_repair import repair_json
+from src.ResultCache import normalize_query
+
+
+def iter_json_objects(chunks):
+    """
+    Yield every top level object of a JSON array (like the decomposition output) as soon as its text is complete,
+    while the text is still being streamed. The objects are parsed with `repair_json`, so the single quoted
+    strings the LLM tends to produce are fine.
+    """
+    text = ""
+    depth = 0
+    quote = None
+    escaped = False
+    start = None
+    for chunk in chunks:
+        offset = len(text)
+        text += chunk
+        for idx in range(offset, len(text)):
+            char = text[idx]
+            if quote is not None:
+                if escaped:
+                    escaped = False
+                elif char == "\\":
+                    escaped = True
+                elif char == quote:
+                    quote = None
+            elif char in "\"'" and depth > 0:
+                quote = char
+            elif char == "{":
+                if depth == 0:
+                    start = idx
+                depth += 1
+            elif char == "}" and depth > 0:
+                depth -= 1
+                if depth == 0:
+                    obj = json.loads(repair_json(text[start:idx + 1]))
+                    if isinstance(obj, dict):
+                        yield obj
+
+
+def is_sub_query(obj) -> bool:
+    return isinstance(obj, dict) and isinstance(obj.get("query"), str) and isinstance(obj.get("version"), str)
+
+
+def parse_sub_queries(text: str) -> list:
+    """
+    Parse the whole decomposition output. This is the reference result, `iter_json_objects` can miss objects
+    (an apostrophe inside a single quoted string throws its quote tracking off).
+    """
+    parsed = repair_json(text, return_objects=True)
+    return [obj for obj in (parsed if isinstance(parsed, list) else [parsed]) if is_sub_query(obj)]
+
+
+def sub_query_key(sub_query: dict):
+    return normalize_query(sub_query["query"]), sub_query["version"]
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The tests import the app modules (src) & the ingestion scripts the same way they import each other.
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root)
+sys.path.append(os.path.join(root, "scripts"))
@@ -0,0 +1,54 @@
+import csv
+import glob
+import gzip
+import re
+import pytest
+from bulkLoad import bulkLoad
+
+
+class StageCursor:
+    """
+    Records the statements and answers a PUT like Snowflake (a row per matched file), keeping the uploaded rows.
+    """
+    def __init__(self, status = "UPLOADED"):
+        self.status = status
+        self.statements = []
+        self.uploaded = []
+        self._results = []
+
+
+    def execute(self, statement):
+        self.statements.append(statement)
+        if statement.startswith("PUT"):
+            paths = sorted(glob.glob(re.match(r"PUT 'file://([^']+)'", statement).group(1)))
+            self._results = []
+            for path in paths:
+                with gzip.open(path, 'rt', encoding='utf-8', newline='') as fp:
+                    self.uploaded.extend(list(csv.reader(fp))[1:])
+                self._results.append((path, path, 10, 10, "GZIP", "GZIP", self.status, ""))
+
+
+    def fetchall(self):
+        return self._results
+
+
+def test_parts_are_uploaded_with_one_put():
+    cursor = StageCursor()
+    rows = [(str(idx), f"content {idx}") for idx in range(5)]
+
+    assert bulkLoad(cursor, "CHUNKS", ["CHUNK_ID", "FILE_CONTENT"], rows, file_rows=2, parallel=8) == 5
+
+    puts = [statement for statement in cursor.statements if statement.startswith("PUT")]
+    assert len(puts) == 1
+    assert "part_*.csv.gz" in puts[0] and "PARALLEL=8" in puts[0]
+    assert [tuple(row) for row in cursor.uploaded] == rows
+    assert cursor.statements[-1].startswith("COPY INTO CHUNKS (CHUNK_ID, FILE_CONTENT)")
+
+
+def test_failed_upload_is_not_loaded():
+    cursor = StageCursor(status="ERROR")
+
+    with pytest.raises(Exception, match="Stage upload failed"):
+        bulkLoad(cursor, "CHUNKS", ["CHUNK_ID", "FILE_CONTENT"], [("1", "content")])
+
+    assert not any(statement.startswith("COPY") for statement in cursor.statements)
@@ -0,0 +1,54 @@
+from src.decomposition import iter_json_objects, parse_sub_queries, sub_query_key
+
+output = """[
+    {
+        'query': 'How does caching work in the app router?',
+        'version': 'v15.0.0',
+    },
+    {
+        'query': 'What's the default fetch cache',
+        'version': 'v15.0.0',
+    },
+    {
+        'query': 'How to opt out of caching',
+        'version': 'v14.0.0',
+    }
+]"""
+
+
+def chunks(text, size = 7):
+    return [text[start:start + size] for start in range(0, len(text), size)]
+
+
+def test_streamed_objects_are_yielded_as_they_complete():
+    text = """[{'query': 'What is ISR?', 'version': 'v15.0.0'}, {"query": "Use \\"next/image\\"", "version": "v14.0.0"}]"""
+    assert list(iter_json_objects(chunks(text))) == [
+        {"query": "What is ISR?", "version": "v15.0.0"},
+        {"query": 'Use "next/image"', "version": "v14.0.0"},
+    ]
+
+
+def test_whole_output_finds_sub_queries_with_apostrophes():
+    streamed = list(iter_json_objects(chunks(output)))
+    parsed = parse_sub_queries(output)
+
+    assert [sub_query["query"] for sub_query in parsed] == [
+        "How does caching work in the app router?",
+        "What's the default fetch cache",
+        "How to opt out of caching",
+    ]
+    # The apostrophe throws the streaming parser off, the searches of the rest are started once the stream ends.
+    assert streamed == parsed[:1]
+    dispatched = set(sub_query_key(sub_query) for sub_query in streamed)
+    missed = [sub_query for sub_query in parsed if sub_query_key(sub_query) not in dispatched]
+    assert missed == parsed[1:]
+
+def test_output_that_is_not_a_list():
+    assert parse_sub_queries("{'query': 'What is Next.js?', 'version': 'v15.0.0'}") == [
+        {"query": "What is Next.js?", "version": "v15.0.0"}
+    ]
+    assert parse_sub_queries("What is Next.js?") == []
+
+
+def test_sub_query_key_normalizes_the_query():
+    assert sub_query_key({"query": " What  is ISR? ", "version": "v15"}) == sub_query_key({"query": "what is isr?", "version": "v15"})
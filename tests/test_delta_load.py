@@ -0,0 +1,88 @@
+import json
+import sqlite3
+import pytest
+from deltaLoad import getChunkId, syncRows
+
+columns = ["CHUNK_ID", "RELATIVE_PATH", "FILE_CONTENT", "VERSION"]
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE CHUNKS (CHUNK_ID TEXT, RELATIVE_PATH TEXT, FILE_CONTENT TEXT, VERSION TEXT, TITLE TEXT, DESCRIPTION TEXT)")
+    yield conn
+    conn.close()
+
+
+def getRows(version, contents):
+    return [
+        (getChunkId(version, path, 0, content), path, content, version) for path, content in contents.items()
+    ]
+
+
+def readTable(conn, version):
+    return sorted(conn.execute("SELECT RELATIVE_PATH, FILE_CONTENT FROM CHUNKS WHERE VERSION = ?", (version,)).fetchall())
+
+
+def test_only_new_rows_are_inserted_and_vanished_ones_deleted(conn):
+    cursor = conn.cursor()
+    sync = lambda rows: syncRows(cursor, "CHUNKS", "CHUNK_ID", columns, rows, scope=("VERSION", "v15"), placeholder="?")
+
+    assert sync(getRows("v15", {"a.md": "a", "b.md": "b"})) == (2, 0)
+    assert sync(getRows("v15", {"a.md": "a", "b.md": "b changed", "c.md": "c"})) == (2, 1)
+    assert readTable(conn, "v15") == [("a.md", "a"), ("b.md", "b changed"), ("c.md", "c")]
+    assert sync(getRows("v15", {"a.md": "a", "b.md": "b changed", "c.md": "c"})) == (0, 0)
+
+
+def test_sync_is_limited_to_the_scope(conn):
+    cursor = conn.cursor()
+    syncRows(cursor, "CHUNKS", "CHUNK_ID", columns, getRows("v14", {"a.md": "a"}), scope=("VERSION", "v14"), placeholder="?")
+    syncRows(cursor, "CHUNKS", "CHUNK_ID", columns, getRows("v15", {"b.md": "b"}), scope=("VERSION", "v15"), placeholder="?")
+
+    assert readTable(conn, "v14") == [("a.md", "a")]
+    assert readTable(conn, "v15") == [("b.md", "b")]
+
+
+def test_rows_loaded_without_identity_are_replaced(conn):
+    conn.execute("INSERT INTO CHUNKS (RELATIVE_PATH, FILE_CONTENT, VERSION) VALUES ('a.md', 'a', 'v15'), ('a.md', 'a', 'v14')")
+    cursor = conn.cursor()
+
+    inserted, _ = syncRows(
+        cursor, "CHUNKS", "CHUNK_ID", columns, getRows("v15", {"a.md": "a"}), scope=("VERSION", "v15"), placeholder="?"
+    )
+
+    assert inserted == 1
+    assert conn.execute("SELECT COUNT(*) FROM CHUNKS WHERE VERSION = 'v15' AND CHUNK_ID IS NULL").fetchone()[0] == 0
+    # Other versions are synced on their own.
+    assert conn.execute("SELECT COUNT(*) FROM CHUNKS WHERE VERSION = 'v14' AND CHUNK_ID IS NULL").fetchone()[0] == 1
+
+
+def test_rows_are_loaded_in_batches(conn):
+    cursor = conn.cursor()
+    batches = []
+
+    def insert(rows):
+        batches.append(len(rows))
+        cursor.executemany("INSERT INTO CHUNKS (CHUNK_ID, RELATIVE_PATH, FILE_CONTENT, VERSION) VALUES (?, ?, ?, ?)", rows)
+
+    rows = getRows("v15", {f"{idx}.md": str(idx) for idx in range(5)})
+    syncRows(cursor, "CHUNKS", "CHUNK_ID", columns, iter(rows), placeholder="?", insert=insert, load_batch_size=2)
+
+    assert batches == [2, 2, 1]
+    assert len(readTable(conn, "v15")) == 5
+
+
+def test_sync_docs_from_staging_file(conn, tmp_path, monkeypatch):
+    pytest.importorskip("snowflake.connector")
+    from snowSetup import SnowSetup
+
+    monkeypatch.setenv("SNOWFLAKE_DOC_TABLE_NAME", "CHUNKS")
+    staging_file = tmp_path / "15.jsonl"
+    staging_file.write_text("\n".join(json.dumps({"path": path, "content": path[0]}) for path in ["a.md", "b.md"]))
+    setup = SnowSetup(conn, placeholder="?")
+
+    setup.syncDocs("v15", str(staging_file))
+    staging_file.write_text(json.dumps({"path": "a.md", "content": "a"}))
+    setup.syncDocs("v15", str(staging_file))
+
+    assert readTable(conn, "v15") == [("a.md", "a")]
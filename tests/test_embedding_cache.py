@@ -0,0 +1,24 @@
+from src.EmbeddingCache import EmbeddingCache
+
+
+def test_every_digest_hits_after_add(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model", 4)
+    texts = [f"text{idx}" for idx in range(1000)]
+    # Digests ending with NUL bytes are the ones a bytes ("S") field would lose.
+    assert any(EmbeddingCache.digest(text).endswith(b"\x00") for text in texts)
+
+    cache.add_many(texts, [[idx, 0, 0, 1] for idx in range(len(texts))])
+    embeddings = cache.get_many(texts)
+
+    assert [embedding[0] for embedding in embeddings] == list(range(len(texts)))
+    assert cache.stats()["hit_ratio"] == 1.0
+
+
+def test_records_of_other_processes_are_read(tmp_path):
+    writer = EmbeddingCache(str(tmp_path), "org/model", 2)
+    reader = EmbeddingCache(str(tmp_path), "org/model", 2)
+    assert reader.get_many(["a"]) == [None]
+
+    writer.add_many(["a", "b"], [[1, 2], [3, 4]])
+
+    assert reader.get_many(["b", "a", "c"]) == [[3.0, 4.0], [1.0, 2.0], None]
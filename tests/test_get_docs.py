@@ -0,0 +1,101 @@
+import threading
+import pytest
+import requests
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from getDocs import downloadFile
+
+
+class ZipballServer(ThreadingHTTPServer):
+    """
+    Serves one file with an ETag, supports If-None-Match & Range/If-Range and can cut the next response short.
+    """
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), ZipballHandler)
+        self.body = b""
+        self.etag = None
+        self.cut_after = None
+        self.requests = []
+
+
+class ZipballHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+
+        if self.headers.get("If-None-Match") == server.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        start = 0
+        if self.headers.get("Range") and self.headers.get("If-Range") == server.etag:
+            start = int(self.headers["Range"][len("bytes="):-1])
+        body = server.body[start:]
+
+        self.send_response(206 if start else 200)
+        self.send_header("ETag", server.etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if server.cut_after is not None:
+            body, server.cut_after = body[:server.cut_after], None
+        self.wfile.write(body)
+
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ZipballServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_interrupted_revalidation_is_resumed_and_not_taken_as_up_to_date(server, tmp_path):
+    url = f"http://127.0.0.1:{server.server_port}/zipball"
+    save_path = str(tmp_path / "v15.0.0.zip")
+    session = requests.Session()
+
+    server.body, server.etag = b"old release", '"v1"'
+    downloadFile(session, url, save_path)
+    assert open(save_path, 'rb').read() == b"old release"
+
+    new_release = bytes(range(256)) * 12 * 1024
+    server.body, server.etag, server.cut_after = new_release, '"v2"', len(new_release) // 2
+    with pytest.raises(requests.exceptions.RequestException):
+        downloadFile(session, url, save_path)
+    # The finished file keeps the ETag of its own content.
+    assert open(save_path + ".etag").read() == '"v1"'
+    downloaded = (tmp_path / "v15.0.0.zip.part").stat().st_size
+    assert downloaded > 0
+
+    downloadFile(session, url, save_path)
+
+    assert server.requests[-1]["Range"] == f"bytes={downloaded}-"
+    assert server.requests[-1]["If-Range"] == '"v2"'
+    assert open(save_path, 'rb').read() == new_release
+    assert open(save_path + ".etag").read() == '"v2"'
+    assert not (tmp_path / "v15.0.0.zip.part").exists()
+
+    downloadFile(session, url, save_path)
+    assert server.requests[-1]["If-None-Match"] == '"v2"'
+
+
+def test_partial_file_of_a_changed_release_starts_over(server, tmp_path):
+    url = f"http://127.0.0.1:{server.server_port}/zipball"
+    save_path = str(tmp_path / "v15.0.0.zip")
+    session = requests.Session()
+
+    server.body, server.etag, server.cut_after = b"first" * 100, '"v1"', 200
+    with pytest.raises(requests.exceptions.RequestException):
+        downloadFile(session, url, save_path)
+
+    server.body, server.etag = b"second" * 100, '"v2"'
+    downloadFile(session, url, save_path)
+
+    assert open(save_path, 'rb').read() == b"second" * 100
+    assert open(save_path + ".etag").read() == '"v2"'
@@ -0,0 +1,164 @@
+import json
+import sqlite3
+import threading
+import pytest
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from githubPosts import GithubPostReader
+
+
+class GraphQLServer(ThreadingHTTPServer):
+    """
+    Fake GitHub GraphQL search: serves `pages` of nodes (cursor "c<n>" after the n-th page), answers the next
+    requests with the statuses of `failures` first, always fails the pages after `broken_cursors` & reports
+    `remaining` in the rate limit.
+    """
+    def __init__(self, pages):
+        super().__init__(("127.0.0.1", 0), GraphQLHandler)
+        self.pages = pages
+        self.failures = []
+        self.broken_cursors = {}
+        self.remaining = 5000
+        self.reset_at = datetime.now(timezone.utc) + timedelta(hours=1)
+        self.requests = []
+
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}/graphql"
+
+
+class GraphQLHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        variables = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["variables"]
+        server.requests.append(variables)
+
+        if server.failures or variables["cursor"] in server.broken_cursors:
+            status, headers = server.failures.pop(0) if server.failures else (server.broken_cursors[variables["cursor"]], {})
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(b"failed")
+            return
+
+        page = 0 if variables["cursor"] is None else int(variables["cursor"][1:])
+        data = {
+            "rateLimit": {"cost": 1, "remaining": server.remaining, "resetAt": server.reset_at.isoformat().replace("+00:00", "Z")},
+            "search": {
+                "pageInfo": {"hasNextPage": page + 1 < len(server.pages), "endCursor": f"c{page + 1}"},
+                "nodes": server.pages[page],
+            }
+        }
+        body = json.dumps({"data": data}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def log_message(self, *args):
+        pass
+
+
+def getNodes(page, count = 2):
+    return [
+        {"title": f"Issue {page}.{idx}", "url": f"https://github.com/vercel/next.js/issues/{page}{idx}", "body": "...", "updatedAt": "2024-06-01T00:00:00Z"}
+        for idx in range(count)
+    ]
+
+
+@pytest.fixture
+def server():
+    server = GraphQLServer([getNodes(page) for page in range(3)])
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_pages_are_followed_with_the_biggest_page_size(server, tmp_path):
+    reader = GithubPostReader("Issue", checkpoint_dir=str(tmp_path), url=server.url, sleep=lambda seconds: None)
+
+    pages = list(reader.pages("repo:vercel/next.js"))
+
+    assert [cursor for _, cursor in pages] == ["c1", "c2", "c3"]
+    assert [node["title"] for nodes, _ in pages for node in nodes][:3] == ["Issue 0.0", "Issue 0.1", "Issue 1.0"]
+    assert [request["cursor"] for request in server.requests] == [None, "c1", "c2"]
+    assert all(request["first"] == 100 for request in server.requests)
+
+
+def test_throttled_requests_are_retried(server, tmp_path):
+    sleeps = []
+    reader = GithubPostReader("Issue", checkpoint_dir=str(tmp_path), url=server.url, sleep=sleeps.append)
+    server.failures = [(429, {"Retry-After": "7"}), (502, {})]
+
+    pages = list(reader.pages("repo:vercel/next.js"))
+
+    assert len(pages) == 3
+    # Retry-After of the secondary rate limit, then the backoff of the 2nd attempt.
+    assert sleeps == [7, 2]
+
+
+def test_retries_give_up(server, tmp_path):
+    reader = GithubPostReader("Issue", checkpoint_dir=str(tmp_path), url=server.url, max_retries=2, sleep=lambda seconds: None)
+    server.failures = [(503, {})] * 3
+
+    with pytest.raises(Exception, match="503"):
+        list(reader.pages("repo:vercel/next.js"))
+
+    server.failures = [(401, {})]
+    with pytest.raises(Exception, match="401"):
+        list(reader.pages("repo:vercel/next.js"))
+    assert len(server.requests) == 4
+
+
+def test_exhausted_rate_limit_waits_for_the_reset(server, tmp_path):
+    sleeps = []
+    reader = GithubPostReader("Issue", checkpoint_dir=str(tmp_path), url=server.url, sleep=sleeps.append)
+    server.remaining = 1
+    server.reset_at = datetime.now(timezone.utc) + timedelta(seconds=30)
+
+    next(reader.pages("repo:vercel/next.js"))
+
+    assert len(sleeps) == 1 and 29 <= sleeps[0] <= 31
+
+
+def test_interrupted_sync_resumes_from_the_checkpoint(server, tmp_path, monkeypatch):
+    pytest.importorskip("snowflake.connector")
+    from snowSetup import SnowSetup
+
+    monkeypatch.setenv("GITHUB_GRAPHQL_URL", server.url)
+    monkeypatch.setenv("CHUNK_CSV_OUTPUT", str(tmp_path))
+    monkeypatch.setenv("SNOWFLAKE_POSTS_TABLE_NAME", "POSTS")
+    monkeypatch.setenv("REPO_NAME", "vercel/next.js")
+    monkeypatch.setenv("POSTS_LOAD_BATCH", "2")
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE POSTS (TITLE TEXT, URL TEXT, CONTENT TEXT, TYPE TEXT, UPDATED_AT TEXT)")
+    setup = SnowSetup(conn, placeholder="?")
+    checkpoint_path = tmp_path / "github_issue.json"
+
+    # The last page fails (not retried), the first two are loaded already.
+    server.broken_cursors = {"c2": 401}
+    setup.processGithubPost("Issue")
+
+    assert conn.execute("SELECT COUNT(*) FROM POSTS").fetchone()[0] == 4
+    checkpoint = json.loads(checkpoint_path.read_text())
+    assert checkpoint["cursor"] == "c2"
+    assert "updated:>=2024-01-01" in checkpoint["query"]
+
+    server.broken_cursors = {}
+    setup.processGithubPost("Issue")
+
+    assert server.requests[-1] == {"query": checkpoint["query"], "cursor": "c2", "first": 100}
+    assert conn.execute("SELECT COUNT(*) FROM POSTS").fetchone()[0] == 6
+    assert not checkpoint_path.exists()
+
+    # A new sync starts from the posts that are loaded.
+    sent = len(server.requests)
+    setup.processGithubPost("Issue")
+    assert server.requests[sent]["cursor"] is None
+    assert "updated:>=2024-06-01" in server.requests[sent]["query"]
@@ -0,0 +1,73 @@
+from src.QueryRouter import QueryRouter
+
+versions = ["v15", "v14"]
+history = [{"role": "user", "content": "How do I use the app router?"}, {"role": "assistant", "content": "..."}]
+
+
+def test_simple_question_bypasses_the_decomposition():
+    router = QueryRouter()
+
+    assert router.route("How do I configure redirects?", versions, []) == [
+        {"query": "How do I configure redirects?", "version": "v15"}
+    ]
+    assert router.route("How do I configure redirects in v14?", versions, [])[0]["version"] == "v14"
+
+
+def test_comparison_is_decomposed():
+    router = QueryRouter()
+
+    assert router.route("What changed between v14 and v15?", versions, []) is None
+    assert router.stats()["reasons"] == {"versions": 1}
+
+
+def test_follow_up_question_is_decomposed():
+    router = QueryRouter()
+
+    # No reference word, still only makes sense with the earlier messages.
+    assert router.route("And for the pages router?", versions, history) is None
+    assert router.stats()["reasons"] == {"history": 1}
+
+
+def test_classifier_decides_for_follow_up_questions():
+    seen = []
+
+    def classifier(features):
+        seen.append(features)
+        return 0.0
+
+    router = QueryRouter(classifier=classifier)
+
+    assert router.route("And for the pages router?", versions, history) is not None
+    assert seen[0]["history"] is True
+
+
+minor_versions = ["v15.1.0", "v15.0.0", "v14.2.0", "v14.1.0", "v14.0.0", "v13.5.0"]
+
+
+def test_major_version_routes_to_its_newest_minor():
+    router = QueryRouter()
+
+    assert router.route("How do I configure redirects in v14?", minor_versions, [])[0]["version"] == "v14.2.0"
+    assert router.route("How do I configure redirects in nextjs@15?", minor_versions, [])[0]["version"] == "v15.1.0"
+
+
+def test_minor_version_routes_to_that_minor():
+    router = QueryRouter()
+
+    assert router.route("How do I configure redirects in Next.js 14.1?", minor_versions, [])[0]["version"] == "v14.1.0"
+    assert router.route("How do I configure redirects in 13.5?", minor_versions, [])[0]["version"] == "v13.5.0"
+    assert router.route("How do I configure redirects in version 14.0.0?", minor_versions, [])[0]["version"] == "v14.0.0"
+
+
+def test_unknown_version_is_decomposed():
+    router = QueryRouter()
+
+    assert router.route("How do I configure redirects in 14.3?", minor_versions, []) is None
+    assert router.route("How do I configure redirects in v12?", minor_versions, []) is None
+    assert router.stats()["reasons"] == {"versions": 2}
+
+
+def test_two_minors_of_a_major_are_decomposed():
+    router = QueryRouter()
+
+    assert router.route("Are redirects configured the same in 14.1 and 14.2?", minor_versions, []) is None
@@ -0,0 +1,60 @@
+import time
+import sqlite3
+from src.ResultCache import ResultCache, invalidate_shared, get_retrieval_cache
+
+
+def test_shared_invalidation_drops_the_entries(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = ResultCache("retrieval:docs", path=path)
+    cache.set("key", ["chunk"])
+    assert cache.get("key") == ["chunk"]
+
+    invalidate_shared("retrieval:docs", path=path)
+
+    assert cache.get("key") is None
+
+
+def test_entries_cached_while_the_invalidation_settles_expire_with_it(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = ResultCache("retrieval:docs", path=path)
+    invalidate_shared("retrieval:docs", path=path, settle=0.05)
+    cache.set("key", ["stale chunk"])
+    assert cache.get("key") == ["stale chunk"]
+
+    time.sleep(0.06)
+    assert cache.get("key") is None
+
+    cache.set("key", ["chunk"])
+    assert ResultCache("retrieval:docs", path=path).get("key") == ["chunk"]
+
+
+def test_generations_table_without_settling_time_is_migrated(tmp_path):
+    path = str(tmp_path / "cache.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE generations (namespace TEXT PRIMARY KEY, generation INTEGER)")
+    conn.execute("INSERT INTO generations VALUES ('retrieval:docs', 3)")
+    conn.commit()
+    conn.close()
+
+    invalidate_shared("retrieval:docs", path=path, settle=60)
+    cache = ResultCache("retrieval:docs", path=path)
+
+    assert cache._generation() == 4
+
+
+def test_retrieval_cache_needs_the_shared_tier(tmp_path, monkeypatch):
+    monkeypatch.setenv("RESULT_CACHE_PATH", "")
+    get_retrieval_cache.cache_clear()
+    assert get_retrieval_cache("docs") is None
+
+    path = str(tmp_path / "cache.db")
+    monkeypatch.setenv("RESULT_CACHE_PATH", path)
+    get_retrieval_cache.cache_clear()
+    cache = get_retrieval_cache("docs")
+    cache.set("key", ["chunk"])
+
+    # What insertDocs does from another process.
+    invalidate_shared("retrieval:docs")
+
+    assert cache.get("key") is None
+    get_retrieval_cache.cache_clear()
@@ -0,0 +1,43 @@
+import os
+import time
+from src.SemanticCache import SemanticCache
+
+
+def test_similar_question_in_the_same_scope(tmp_path):
+    cache = SemanticCache(threshold=0.9)
+    cache.set([1, 0, 0], ("v15",), "answer")
+
+    assert cache.get([0.95, 0.1, 0], ("v15",)) == "answer"
+    assert cache.get([0.95, 0.1, 0], ("v14",)) is None
+    assert cache.get([0, 1, 0], ("v15",)) is None
+
+
+def test_least_recently_used_answers_are_evicted():
+    cache = SemanticCache(max_size=2)
+    cache.set([1, 0, 0], ("v15",), "a")
+    cache.set([0, 1, 0], ("v15",), "b")
+    cache.get([1, 0, 0], ("v15",))
+    cache.set([0, 0, 1], ("v15",), "c")
+
+    assert cache.get([0, 1, 0], ("v15",)) is None
+    assert cache.get([1, 0, 0], ("v15",)) == "a"
+
+
+def test_answers_expire():
+    cache = SemanticCache(ttl=0.01)
+    cache.set([1, 0], ("v15",), "a")
+    time.sleep(0.02)
+
+    assert cache.get([1, 0], ("v15",)) is None
+
+
+def test_rebuilt_index_drops_the_answers_without_the_shared_tier(tmp_path):
+    stamp = tmp_path / "terms.json"
+    stamp.write_text("{}")
+    cache = SemanticCache(stamp_paths=[str(stamp)])
+    cache.set([1, 0], ("v15",), "a")
+    assert cache.get([1, 0], ("v15",)) == "a"
+
+    os.utime(stamp, (time.time() + 10, time.time() + 10))
+
+    assert cache.get([1, 0], ("v15",)) is None